@@ -0,0 +1,194 @@
+"""Benchmark how long the SWOT advisor page takes per reply as a chat grows.
+
+Runs the real gap_analysiss page headless through Streamlit's AppTest with
+the Perplexity chain replaced by a canned reply, submits --messages chat
+inputs one by one and reports the script run time per submission at a few
+conversation lengths for:
+
+    full      - every submission reruns the whole page (the previous behaviour)
+    fragment  - submissions rerun only the chat_panel fragment, as the browser
+                does, with a full page run whenever its backlog is flushed
+
+AppTest itself always reruns the whole script, so the fragment mode keeps the
+fragment storage across runs and asks for the fragment-scoped rerun that the
+browser would send. That relies on AppTest internals of the Streamlit release
+pinned in requirements.txt; check_streamlit_internals() stops with a clear
+message if they change. Run from backend/api:
+
+    python benchmark_chat_rendering.py --messages 250 --report 10 100 500
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+import inspect
+import streamlit
+
+# Streamlit release the AppTest internals below were written against (see requirements.txt)
+TESTED_STREAMLIT = "1.42"
+
+try:
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+    from streamlit.runtime.fragment import MemoryFragmentStorage
+    from streamlit.runtime.scriptrunner_utils.script_requests import RerunData
+    from streamlit.testing.v1 import AppTest, app_test
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner, require_widgets_deltas
+    from streamlit.testing.v1.element_tree import parse_tree_from_messages
+except ImportError as e:
+    raise ImportError(
+        f"benchmark_chat_rendering needs the AppTest internals of Streamlit {TESTED_STREAMLIT}, "
+        f"which moved in Streamlit {streamlit.__version__}: {str(e)}") from e
+
+PAGE = """
+import gap_analysiss
+from langchain_core.runnables import RunnableLambda
+
+REPLY = '''**Strengths**
+- **Domain knowledge**: Several years in retail operations
+- **Network**: Existing supplier relationships
+
+**Weaknesses**
+- **Financial planning**: No experience preparing cash flow projections
+'''
+
+# Canned advisor reply instead of a Perplexity call
+gap_analysiss.setup_chain = lambda: RunnableLambda(lambda inputs: REPLY)
+gap_analysiss.main()
+"""
+
+# Streamlit warns once per widget when session state is touched outside a run
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+
+def check_streamlit_internals():
+    """Fail with a clear message if the AppTest internals used here have changed"""
+    missing = []
+    if not isinstance(getattr(MemoryFragmentStorage(), "_fragments", None), dict):
+        missing.append("MemoryFragmentStorage._fragments")
+    for field in ("fragment_id_queue", "is_fragment_scoped_rerun"):
+        if field not in getattr(RerunData, "__dataclass_fields__", {}):
+            missing.append(f"RerunData.{field}")
+    if list(inspect.signature(LocalScriptRunner.run).parameters) != [
+            "self", "widget_state", "query_params", "timeout", "page_hash"]:
+        missing.append("LocalScriptRunner.run(widget_state, query_params, timeout, page_hash)")
+    if "page_profile" not in ForwardMsg.DESCRIPTOR.fields_by_name:
+        missing.append("ForwardMsg.page_profile")
+    if missing:
+        internals_changed(", ".join(missing))
+
+
+def internals_changed(detail):
+    raise RuntimeError(
+        f"benchmark_chat_rendering was written against Streamlit {TESTED_STREAMLIT} and "
+        f"Streamlit {streamlit.__version__} changed: {detail}")
+
+
+def chat_panel_fragment_id():
+    """Fragment id of chat_panel, the first fragment the advisor pages register"""
+    # Its id changes whenever a full run draws more history above it
+    return next(iter(FragmentScriptRunner.storage._fragments))
+
+
+class FragmentScriptRunner(LocalScriptRunner):
+    """AppTest script runner that can rerun a single fragment.
+
+    Fragments registered by a full run are kept in a storage shared by every
+    runner, and setting ``fragment_id`` makes the next run replay only that
+    fragment, as happens when a widget inside it changes in the browser.
+    """
+
+    storage = MemoryFragmentStorage()
+    fragment_id = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not hasattr(self, "_fragment_storage"):
+            internals_changed("ScriptRunner._fragment_storage")
+        self._fragment_storage = FragmentScriptRunner.storage
+
+    @classmethod
+    def install(cls):
+        """Make AppTest use this runner with a fresh fragment storage"""
+        check_streamlit_internals()
+        cls.storage = MemoryFragmentStorage()
+        cls.fragment_id = None
+        app_test.LocalScriptRunner = cls
+
+    def run(self, widget_state=None, query_params=None, timeout=3, page_hash=""):
+        if FragmentScriptRunner.fragment_id is None:
+            return super().run(widget_state, query_params, timeout, page_hash)
+        self.request_rerun(RerunData(
+            widget_states=widget_state,
+            page_script_hash=page_hash,
+            fragment_id_queue=[FragmentScriptRunner.fragment_id],
+            is_fragment_scoped_rerun=True,
+        ))
+        self.start()
+        require_widgets_deltas(self, timeout)
+        # A backlog flush reruns the page within the same request; keep only
+        # the last run's output so its widgets are not listed twice
+        messages = self.forward_msgs()
+        ends = [i for i, msg in enumerate(messages) if msg.WhichOneof("type") == "page_profile"]
+        return parse_tree_from_messages(messages[ends[-2] + 1 if len(ends) > 1 else 0:])
+
+
+def run_session(mode, messages, report):
+    """Submit ``messages`` chat inputs and time each one.
+
+    Returns the seconds taken by the submission that reached each size in
+    ``report``, and the mean over the whole session including backlog flushes.
+    """
+    FragmentScriptRunner.install()
+    at = AppTest.from_string(PAGE, default_timeout=60)
+    at.run()
+
+    timings = {}
+    elapsed_all = []
+    for i in range(messages):
+        if mode == "fragment":
+            FragmentScriptRunner.fragment_id = chat_panel_fragment_id()
+        start = time.perf_counter()
+        at.chat_input[0].set_value(f"Message {i} about my business idea.").run()
+        elapsed = time.perf_counter() - start
+        elapsed_all.append(elapsed)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        size = len(at.session_state["conversation_history"])
+        for target in report:
+            if size - 2 < target <= size:
+                timings[target] = elapsed
+    return timings, statistics.mean(elapsed_all)
+
+
+def print_row(label, full, fragment):
+    full, fragment = statistics.median(full), statistics.median(fragment)
+    print(f"{label:>8} {full * 1000:>9.1f}ms {fragment * 1000:>8.1f}ms {full / fragment:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=250,
+                        help="chat inputs submitted per session, two messages each")
+    parser.add_argument("--report", type=int, nargs="+", default=[10, 100, 500],
+                        help="conversation lengths to report")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep the benchmark's report queue out of data/
+        os.environ["REPORT_QUEUE_PATH"] = os.path.join(tmp, "report_jobs.db")
+        runs = {mode: [run_session(mode, args.messages, args.report) for _ in range(args.repeat)]
+                for mode in ("full", "fragment")}
+
+    print(f"{'messages':>8} {'full page':>11} {'fragment':>10} {'speedup':>8}")
+    for size in args.report:
+        if all(size in timings for timings, _ in runs["full"]):
+            print_row(str(size), *([timings[size] for timings, _ in runs[mode]]
+                                   for mode in ("full", "fragment")))
+    print_row("mean", *([mean for _, mean in runs[mode]] for mode in ("full", "fragment")))
+
+
+if __name__ == "__main__":
+    main()
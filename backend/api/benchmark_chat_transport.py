@@ -0,0 +1,192 @@
+"""Benchmark POST-per-message chat against the multiplexed WebSocket channel.
+
+Both transports are served by a local app whose advisor streams a fixed reply
+token by token, so the numbers reflect transport and connection overhead
+rather than Perplexity latency. The server runs in its own process and
+counts the TCP connections it accepts and the CPU time it spends, so those
+figures cover the server side only. Run from backend/api:
+
+    python benchmark_chat_transport.py --messages 200 --channels 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+import uvicorn
+import websockets
+from fastapi import FastAPI, WebSocket
+from pydantic import BaseModel
+from chat_socket import ChatSession
+
+REPLY_TOKENS = ["This ", "is ", "a ", "benchmark ", "reply ", "from ", "the ", "advisor."]
+STATS_PATH = "/_stats"
+
+# One log line per POST would drown the results
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+class ChatRequest(BaseModel):
+    message: str
+
+
+async def stream_reply(history, message, tenant=None):
+    for token in REPLY_TOKENS:
+        yield token
+
+
+class ConnectionCounter:
+    """ASGI middleware counting distinct client sockets seen by the server"""
+
+    def __init__(self, app):
+        self.app = app
+        self.clients = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket") and scope["path"] != STATS_PATH:
+            self.clients.add(tuple(scope["client"]))
+        await self.app(scope, receive, send)
+
+
+def build_app():
+    app = FastAPI()
+    counter = ConnectionCounter(app)
+
+    @app.post("/chat")
+    async def chat(request: ChatRequest):
+        return {"response": "".join([token async for token in stream_reply([], request.message)])}
+
+    @app.websocket("/ws/chat")
+    async def chat_socket(websocket: WebSocket):
+        await ChatSession(websocket, {"chat": stream_reply}).run()
+
+    @app.get(STATS_PATH)
+    async def stats():
+        return {"connections": len(counter.clients), "cpu_seconds": time.process_time()}
+
+    return counter
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_server():
+    port = free_port()
+    server = subprocess.Popen([sys.executable, __file__, "--serve", str(port)])
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}{STATS_PATH}")
+            return server, port
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Benchmark server did not start")
+
+
+def server_stats(port):
+    return httpx.get(f"http://127.0.0.1:{port}{STATS_PATH}").json()
+
+
+async def bench_post(port, messages):
+    """A fresh connection per message, as frontend/src/api.js did"""
+    latencies = []
+    for i in range(messages):
+        start = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            response = await client.post(f"http://127.0.0.1:{port}/chat",
+                                         json={"message": f"message {i}"})
+            response.json()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def bench_websocket(port, messages, channels):
+    """One connection, messages spread over concurrent channels"""
+    latencies = []
+    async with websockets.connect(f"ws://127.0.0.1:{port}/ws/chat") as ws:
+        waiters = {}
+
+        async def receive():
+            try:
+                async for raw in ws:
+                    frame = json.loads(raw)
+                    if frame["type"] == "done":
+                        waiters.pop(frame["channel"]).set_result(time.perf_counter())
+                    elif frame["type"] == "error":
+                        waiters.pop(frame["channel"]).set_exception(
+                            RuntimeError(frame["error"]))
+            finally:
+                # Never leave a sender waiting on a reply that cannot arrive
+                for waiter in waiters.values():
+                    if not waiter.done():
+                        waiter.set_exception(RuntimeError("Connection closed"))
+
+        receiver = asyncio.create_task(receive())
+
+        async def run_channel(channel, count):
+            for i in range(count):
+                done = asyncio.get_running_loop().create_future()
+                waiters[channel] = done
+                start = time.perf_counter()
+                await ws.send(json.dumps({"type": "message", "channel": channel,
+                                          "content": f"message {i}"}))
+                latencies.append(await done - start)
+
+        per_channel = messages // channels
+        try:
+            await asyncio.gather(*(run_channel(f"c{c}", per_channel) for c in range(channels)))
+        finally:
+            receiver.cancel()
+    return latencies
+
+
+def run(name, port, scenario):
+    before = server_stats(port)
+    start = time.perf_counter()
+    latencies = sorted(asyncio.run(scenario))
+    elapsed = time.perf_counter() - start
+    after = server_stats(port)
+
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    cpu = after["cpu_seconds"] - before["cpu_seconds"]
+    print(f"{name:<10} messages={len(latencies):<5} "
+          f"connections={after['connections'] - before['connections']:<5} "
+          f"server_cpu={cpu * 1000 / len(latencies):6.3f}ms/msg "
+          f"mean={statistics.mean(latencies) * 1000:7.2f}ms "
+          f"p50={statistics.median(latencies) * 1000:7.2f}ms "
+          f"p99={p99 * 1000:7.2f}ms "
+          f"throughput={len(latencies) / elapsed:8.1f} msg/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        uvicorn.run(build_app(), port=args.serve, log_level="warning")
+        return
+
+    server, port = start_server()
+    try:
+        run("POST", port, bench_post(port, args.messages))
+        run("WebSocket", port, bench_websocket(port, args.messages, args.channels))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Simulate interactive chat latency while a workshop runs batch reports.
+
+LLM calls are replaced by sleeps, and the upstream quota is modelled as the
+scheduler's concurrency limit. Each scenario runs interactive chat users from
+two centres next to a third centre's batch of report generations, and prints
+interactive latency percentiles for:
+
+    baseline  - interactive traffic only
+    fifo      - one shared first-come-first-served queue (the previous behaviour)
+    fair      - LLMScheduler with priority classes and per-cohort fair queuing
+
+Run from backend/api:
+
+    python benchmark_llm_scheduler.py --duration 10 --batch-workers 16
+"""
+import argparse
+import threading
+import time
+from llm_scheduler import LLMScheduler, INTERACTIVE, BATCH
+
+CHAT_SECONDS = 0.05  # simulated LLM time of one chat turn
+REPORT_SECONDS = 0.4  # simulated LLM time of one full report
+THINK_SECONDS = 0.1  # pause between a user's chat messages
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_scenario(mode, args):
+    scheduler = LLMScheduler(max_concurrency=args.concurrency, max_tenant_depth=1000)
+    stop = threading.Event()
+    latencies = []
+    reports = []
+
+    def call(tenant, priority, seconds):
+        if mode == "fifo":
+            tenant, priority = "shared", INTERACTIVE
+        start = time.perf_counter()
+        with scheduler.slot(tenant, priority):
+            time.sleep(seconds)
+        return time.perf_counter() - start
+
+    def chat_user(tenant):
+        while not stop.is_set():
+            latency = call(tenant, INTERACTIVE, CHAT_SECONDS)
+            if not stop.is_set():
+                latencies.append(latency)
+            time.sleep(THINK_SECONDS)
+
+    def report_worker():
+        while not stop.is_set():
+            call("workshop", BATCH, REPORT_SECONDS)
+            if not stop.is_set():
+                reports.append(1)
+
+    threads = [threading.Thread(target=chat_user, args=(f"centre-{i % 2}",))
+               for i in range(args.chat_users)]
+    if mode != "baseline":
+        threads += [threading.Thread(target=report_worker) for _ in range(args.batch_workers)]
+
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "chats": len(latencies),
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "reports_per_s": len(reports) / args.duration,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--chat-users", type=int, default=6)
+    parser.add_argument("--batch-workers", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<10} {'chats':>6} {'p50':>9} {'p99':>9} {'reports/s':>10}")
+    for mode in ("baseline", "fifo", "fair"):
+        result = run_scenario(mode, args)
+        print(f"{mode:<10} {result['chats']:>6} {result['p50'] * 1000:>7.1f}ms "
+              f"{result['p99'] * 1000:>7.1f}ms {result['reports_per_s']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
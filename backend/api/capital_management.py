@@ -3,6 +3,7 @@ import os
 import logging
 from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from chat_rendering import render_history, chat_panel
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -223,37 +224,28 @@ def main():
         st.session_state.conversation_history.append(
             AIMessage(content=initial_message))
 
-    # Display conversation history so far
-    for message in st.session_state.conversation_history:
-        if isinstance(message, HumanMessage):
-            st.chat_message("user").write(message.content)
-        else:
-            st.chat_message("assistant").write(message.content)
-
-    # Get user input from chat box
-    user_input = st.chat_input("Describe your business idea...")
-
-    if user_input:
-        st.chat_message("user").write(user_input)
-
-        with st.spinner("Finding the best funding options..."):
-            try:
-                # Generate funding recommendations based on input
-                response = recommend_funding_schemes(user_input)
-                st.session_state.conversation_history.append(
-                    HumanMessage(content=user_input))
-                st.session_state.conversation_history.append(
-                    AIMessage(content=response))
-                st.chat_message("assistant").write(response)
-            except Exception as e:
-                logger.error(f"Error processing input: {str(e)}")
-                st.error(
-                    f"An error occurred while processing your input. Please try again.")
-
-                if hasattr(e, 'response') and e.response is not None:
-                    logger.error(f"HTTP response: {e.response.text}")
-
-                st.error(f"An error occurred: {str(e)}")
+    # Display conversation history so far; new messages are drawn by the chat fragment
+    render_history()
+
+    def respond(user_input):
+        try:
+            # Generate funding recommendations based on input
+            response = recommend_funding_schemes(user_input)
+            st.session_state.conversation_history.append(
+                HumanMessage(content=user_input))
+            st.session_state.conversation_history.append(
+                AIMessage(content=response))
+        except Exception as e:
+            logger.error(f"Error processing input: {str(e)}")
+            st.error(
+                f"An error occurred while processing your input. Please try again.")
+
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"HTTP response: {e.response.text}")
+
+            st.error(f"An error occurred: {str(e)}")
+
+    chat_panel("Describe your business idea...", "Finding the best funding options...", respond)
 
 
 if __name__ == "__main__":
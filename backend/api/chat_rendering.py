@@ -0,0 +1,113 @@
+import streamlit as st
+import logging
+from langchain_core.messages import HumanMessage, AIMessage
+from report_jobs import FINISHED_STATUSES
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Messages the chat fragment may draw on its own before the page is redrawn
+FRAGMENT_BACKLOG = 20
+
+# Recorded as the reply when respond() fails before adding anything to the conversation
+NO_REPLY_MESSAGE = "I'm sorry, I couldn't process your message. Please try again."
+
+
+def render_message(message):
+    """Draw a single conversation message as a chat bubble"""
+    role = "user" if isinstance(message, HumanMessage) else "assistant"
+    st.chat_message(role).markdown(message.content)
+
+
+def render_history():
+    """Draw the whole conversation once per full page run"""
+    history = st.session_state.conversation_history
+    for message in history:
+        render_message(message)
+    # Everything up to here stays on screen while the chat fragment reruns
+    st.session_state.rendered_count = len(history)
+
+
+@st.fragment
+def chat_panel(placeholder, spinner_text, respond):
+    """Chat input plus the messages added since the last full page run.
+
+    Submitting a message only reruns this fragment, so each reply draws the
+    new messages instead of redrawing the full history and rerunning the page.
+    Once more than ``FRAGMENT_BACKLOG`` messages have piled up here, the page
+    is rerun once so they move into the history drawn by ``render_history``
+    and the fragment's work per reply stays bounded.
+    ``respond(user_input)`` should append the user message and the reply to
+    ``st.session_state.conversation_history``. If it adds nothing, the input
+    is recorded with ``NO_REPLY_MESSAGE`` so it does not vanish on the next
+    page run.
+    """
+    messages = st.container()
+    user_input = st.chat_input(placeholder)
+
+    history = st.session_state.conversation_history
+    with messages:
+        for message in history[st.session_state.get("rendered_count", 0):]:
+            render_message(message)
+
+        if user_input:
+            # Show the user's input before waiting on the reply
+            st.chat_message("user").markdown(user_input)
+            before = len(history)
+            with st.spinner(spinner_text):
+                try:
+                    respond(user_input)
+                except Exception as e:
+                    logger.error(f"Error processing input: {str(e)}")
+                    st.error(f"An error occurred: {str(e)}")
+
+            history = st.session_state.conversation_history
+            new_messages = history[before:]
+            if not new_messages:
+                new_messages = [HumanMessage(content=user_input), AIMessage(content=NO_REPLY_MESSAGE)]
+                history.extend(new_messages)
+            if isinstance(new_messages[0], HumanMessage) and new_messages[0].content == user_input:
+                new_messages = new_messages[1:]  # drawn above already
+
+            if len(history) - st.session_state.get("rendered_count", 0) > FRAGMENT_BACKLOG:
+                st.rerun(scope="app")
+            for message in new_messages:
+                render_message(message)
+
+
+@st.fragment(run_every=2)
+def report_jobs_panel(queue):
+    """Poll queued report jobs and put finished reports into the conversation.
+
+    Each entry of ``st.session_state.report_jobs`` holds a ``job_id`` and the
+    ``message_index`` of the placeholder reply shown while the report is
+    generated; the report replaces that placeholder so the conversation keeps
+    alternating between the user and the advisor.
+    """
+    pending = st.session_state.setdefault("report_jobs", [])
+    history = st.session_state.conversation_history
+    finished = False
+    for entry in list(pending):
+        job = queue.get(entry["job_id"])
+        if job is None:
+            pending.remove(entry)
+            continue
+        if job["status"] not in FINISHED_STATUSES:
+            continue
+        pending.remove(entry)
+        if job["status"] == "done":
+            content = job["result"]
+        else:
+            content = f"I'm sorry, I couldn't generate your report due to an error: {job['error']}"
+        if entry["message_index"] < len(history):
+            history[entry["message_index"]] = AIMessage(content=content)
+        else:
+            history.append(AIMessage(content=content))
+        finished = True
+
+    if finished:
+        # Redraw the page once so the report replaces the placeholder on screen
+        st.rerun()
+    elif pending:
+        st.caption(f"Generating {len(pending)} report(s) in the background...")
@@ -0,0 +1,159 @@
+import json
+import asyncio
+import logging
+from fastapi import WebSocket, WebSocketDisconnect
+from langchain_core.messages import HumanMessage, AIMessage
+from llm_scheduler import SchedulerOverloaded, DEFAULT_TENANT, BUSY_MESSAGE
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 15  # seconds between server pings
+HEARTBEAT_TIMEOUT = 45  # drop the connection after this long without any frame
+SEND_QUEUE_SIZE = 256  # frames buffered per connection before producers wait
+MAX_CHANNELS = 8  # concurrent advisor conversations per connection
+
+
+class ChatSession:
+    """One WebSocket connection carrying several advisor conversations.
+
+    Every frame is JSON and tagged with a ``channel`` id chosen by the client,
+    so replies for different conversations can be streamed interleaved over
+    the same socket. Outgoing frames go through a bounded queue: when the
+    client reads slowly the streaming tasks wait on it instead of buffering
+    tokens without limit.
+
+    ``streamers`` maps an advisor name to an async generator function taking
+    ``(history, message, tenant)`` and yielding response tokens.
+    """
+
+    def __init__(self, websocket: WebSocket, streamers, default_advisor="chat",
+                 tenant=DEFAULT_TENANT):
+        self.websocket = websocket
+        self.streamers = streamers
+        self.tenant = tenant
+        self.default_advisor = default_advisor
+        self.outbox = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.histories = {}
+        self.tasks = {}
+        self.last_seen = 0.0
+
+    async def send(self, frame):
+        await self.outbox.put(frame)
+
+    async def run(self):
+        await self.websocket.accept()
+        loop = asyncio.get_running_loop()
+        self.last_seen = loop.time()
+        writer = asyncio.create_task(self._writer())
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            await self._reader()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            for task in [writer, heartbeat, *self.tasks.values()]:
+                task.cancel()
+
+    async def _writer(self):
+        while True:
+            frame = await self.outbox.get()
+            await self.websocket.send_json(frame)
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if loop.time() - self.last_seen > HEARTBEAT_TIMEOUT:
+                logger.info("Closing chat socket after missed heartbeats")
+                await self.websocket.close(code=1001)
+                return
+            # A full outbox already proves the link is busy, so skip this ping
+            if not self.outbox.full():
+                self.outbox.put_nowait({"type": "ping"})
+
+    async def _receive_frame(self):
+        """Next client frame as a dict, or None if it is not a JSON object"""
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        try:
+            frame = json.loads(message.get("text") or message.get("bytes") or "")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+        return frame if isinstance(frame, dict) else None
+
+    async def _reader(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            frame = await self._receive_frame()
+            self.last_seen = loop.time()
+            if frame is None:
+                # A bad frame has no usable channel; keep the other streams going
+                await self.send({"type": "error", "error": "Frames must be JSON objects"})
+                continue
+            frame_type = frame.get("type")
+            channel = str(frame.get("channel", "default"))
+
+            if frame_type == "ping":
+                await self.send({"type": "pong"})
+            elif frame_type == "pong":
+                continue
+            elif frame_type == "message":
+                await self._start_reply(channel, frame)
+            elif frame_type == "cancel":
+                task = self.tasks.pop(channel, None)
+                if task:
+                    task.cancel()
+            elif frame_type == "close":
+                task = self.tasks.pop(channel, None)
+                if task:
+                    task.cancel()
+                self.histories.pop(channel, None)
+            else:
+                await self.send({"type": "error", "channel": channel,
+                                 "error": f"Unknown frame type: {frame_type}"})
+
+    async def _start_reply(self, channel, frame):
+        advisor = frame.get("advisor", self.default_advisor)
+        content = frame.get("content", "")
+        if advisor not in self.streamers:
+            await self.send({"type": "error", "channel": channel,
+                             "error": f"Unknown advisor: {advisor}"})
+        elif channel in self.tasks:
+            await self.send({"type": "error", "channel": channel,
+                             "error": "A reply is already streaming on this channel"})
+        elif len(self.tasks) >= MAX_CHANNELS:
+            await self.send({"type": "error", "channel": channel,
+                             "error": "Too many concurrent conversations"})
+        else:
+            task = asyncio.create_task(self._stream_reply(channel, advisor, content))
+            self.tasks[channel] = task
+            task.add_done_callback(lambda done: self._release(channel, done))
+
+    def _release(self, channel, task):
+        # A cancelled reply may finish after a new one started on its channel
+        if self.tasks.get(channel) is task:
+            del self.tasks[channel]
+
+    async def _stream_reply(self, channel, advisor, content):
+        history = self.histories.setdefault(channel, [])
+        parts = []
+        try:
+            async for token in self.streamers[advisor](history, content, self.tenant):
+                if token:
+                    parts.append(token)
+                    await self.send({"type": "token", "channel": channel, "content": token})
+            history.append(HumanMessage(content=content))
+            history.append(AIMessage(content="".join(parts)))
+            await self.send({"type": "done", "channel": channel})
+        except asyncio.CancelledError:
+            raise
+        except SchedulerOverloaded as e:
+            logger.warning(f"Rejected reply on channel {channel}: {str(e)}")
+            await self.send({"type": "error", "channel": channel, "error": BUSY_MESSAGE})
+        except Exception as e:
+            logger.error(f"Error streaming reply on channel {channel}: {str(e)}")
+            await self.send({"type": "error", "channel": channel,
+                             "error": "I'm sorry, I encountered an error while processing your request. Please try again."})
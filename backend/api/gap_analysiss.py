@@ -3,9 +3,15 @@ import os
 import logging
 from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import messages_to_dict, messages_from_dict
 from langchain_community.chat_models import ChatPerplexity
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
+from chat_rendering import render_history, chat_panel, report_jobs_panel
+from report_jobs import JobQueue, payload_key
+from llm_scheduler import scheduler, SchedulerOverloaded, INTERACTIVE, BATCH, DEFAULT_TENANT
+from llm_scheduler import BUSY_MESSAGE
+from swot_analytics import export_swot_report
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -82,33 +88,63 @@ def setup_chain():
         return None
 
 
-def generate_swot_analysis(conversation_history):
-    """Generate a SWOT analysis based on conversation history"""
-    try:
-        # Initialize model
-        llm = ChatPerplexity(
-            api_key=perplexity_api_key,
-            temperature=0.2,
-            model="sonar-pro",
-        )
+def swot_messages(conversation_history):
+    """Conversation history with the SWOT analysis instructions in front, as sent to the LLM"""
+    # Instead of formatting as text, maintain the message objects with proper role alternation
+    formatted_history = format_conversation_for_api(conversation_history)
+
+    # SWOT analysis system message
+    swot_system = SystemMessage(content="""
+    Based on the conversation history, generate a comprehensive SWOT analysis for the student's 
+    entrepreneurial venture. Format your response clearly with sections for Strengths, Weaknesses, 
+    Opportunities, and Threats. Be specific, actionable, and insightful.
+    """)
+
+    # Add system message at beginning
+    formatted_history.insert(0, swot_system)
+
+    return formatted_history
+
+
+def invoke_swot_analysis(conversation_history, tenant=DEFAULT_TENANT):
+    """Call the LLM for a SWOT analysis, letting any error propagate"""
+    # Initialize model
+    llm = ChatPerplexity(
+        api_key=perplexity_api_key,
+        temperature=0.2,
+        model="sonar-pro",
+    )
+
+    # Use the LLM directly with the properly formatted messages
+    with scheduler.slot(tenant, BATCH):
+        return llm.invoke(swot_messages(conversation_history)).content
+
 
-        # Instead of formatting as text, maintain the message objects with proper role alternation
-        formatted_history = format_conversation_for_api(conversation_history)
+async def astream_swot_analysis(conversation_history, tenant=DEFAULT_TENANT):
+    """Stream the SWOT analysis from the LLM without blocking a thread, letting any error propagate"""
+    # Initialize model
+    llm = ChatPerplexity(
+        api_key=perplexity_api_key,
+        temperature=0.2,
+        model="sonar-pro",
+    )
 
-        # SWOT analysis system message
-        swot_system = SystemMessage(content="""
-        Based on the conversation history, generate a comprehensive SWOT analysis for the student's 
-        entrepreneurial venture. Format your response clearly with sections for Strengths, Weaknesses, 
-        Opportunities, and Threats. Be specific, actionable, and insightful.
-        """)
+    async with scheduler.async_slot(tenant, BATCH):
+        async for chunk in llm.astream(swot_messages(conversation_history)):
+            yield chunk.content
 
-        # Add system message at beginning
-        formatted_history.insert(0, swot_system)
 
-        # Use the LLM directly with the properly formatted messages
-        swot_analysis = llm.invoke(formatted_history).content
+def generate_swot_analysis(conversation_history, tenant=DEFAULT_TENANT):
+    """Generate a SWOT analysis based on conversation history"""
+    try:
+        swot_analysis = invoke_swot_analysis(conversation_history, tenant)
+        export_swot_report(swot_analysis, tenant)
         return swot_analysis
 
+    except SchedulerOverloaded as e:
+        logger.warning(f"Rejected report request: {str(e)}")
+        return BUSY_MESSAGE
+
     except Exception as e:
         logger.error(f"Error generating SWOT analysis: {str(e)}")
         if hasattr(e, 'response') and e.response is not None:
@@ -116,24 +152,62 @@ def generate_swot_analysis(conversation_history):
         return f"I'm sorry, I couldn't generate a SWOT analysis due to an error: {str(e)}"
 
 
-def process_user_input(user_input, conversation_history=None):
+def run_swot_job(payload):
+    """Report worker entry point for queued SWOT jobs"""
+    # Errors, including SchedulerOverloaded, must reach the worker pool so the
+    # job is deferred, retried or marked failed
+    return invoke_swot_analysis(
+        messages_from_dict(payload["conversation_history"]),
+        payload.get("tenant", DEFAULT_TENANT))
+
+
+def export_swot_job(job, swot_analysis):
+    """Report worker hook adding a finished SWOT job to the cohort analytics"""
+    export_swot_report(swot_analysis, job["payload"].get("tenant", DEFAULT_TENANT),
+                       report_id=job["id"])
+
+
+@st.cache_resource
+def get_report_queue():
+    """Open the report job queue; its workers run in the API server (main.py)"""
+    return JobQueue()
+
+
+def enqueue_swot_job(conversation_history, tenant=DEFAULT_TENANT):
+    """Queue a SWOT report and return its job id"""
+    payload = {
+        "conversation_history": messages_to_dict(conversation_history),
+        "tenant": tenant,
+    }
+    return get_report_queue().enqueue("swot", payload, payload_key("swot", payload))
+
+
+def process_user_input(user_input, conversation_history=None, tenant=DEFAULT_TENANT):
     """Process user input and generate an appropriate response"""
     try:
         chain = setup_chain()
-        if chain is None:
-            return "Sorry, there was an error setting up the AI. Please try again.", conversation_history
-
         if conversation_history is None:
             conversation_history = []
 
+        if chain is None:
+            error_msg = "Sorry, there was an error setting up the AI. Please try again."
+            conversation_history.append(HumanMessage(content=user_input))
+            conversation_history.append(AIMessage(content=error_msg))
+            return error_msg, conversation_history
+
         # Add user message to conversation history
         conversation_history.append(HumanMessage(content=user_input))
 
         # Check if SWOT analysis is requested
         if "GENERATE_SWOT" in user_input.upper():
-            swot_analysis = generate_swot_analysis(conversation_history)
-            conversation_history.append(AIMessage(content=swot_analysis))
-            return swot_analysis, conversation_history
+            # Generate in the background so the page stays responsive
+            job_id = enqueue_swot_job(conversation_history, tenant)
+            message = "Your SWOT analysis is being generated. It will appear here as soon as it is ready."
+            # The finished report replaces this placeholder in the conversation
+            st.session_state.setdefault("report_jobs", []).append(
+                {"job_id": job_id, "message_index": len(conversation_history)})
+            conversation_history.append(AIMessage(content=message))
+            return message, conversation_history
 
         # Format history properly for the API
         formatted_history = format_conversation_for_api(
@@ -141,15 +215,22 @@ def process_user_input(user_input, conversation_history=None):
 
         # Generate response from model
         try:
-            response = chain.invoke({
-                "input": user_input,
-                "history": formatted_history
-            })
+            with scheduler.slot(tenant, INTERACTIVE):
+                response = chain.invoke({
+                    "input": user_input,
+                    "history": formatted_history
+                })
 
             # Add response to conversation history
             conversation_history.append(AIMessage(content=response))
             return response, conversation_history
 
+        except SchedulerOverloaded as e:
+            logger.warning(f"Rejected chat request: {str(e)}")
+            error_msg = BUSY_MESSAGE
+            conversation_history.append(AIMessage(content=error_msg))
+            return error_msg, conversation_history
+
         except Exception as e:
             logger.error(f"Error processing chain.invoke: {str(e)}")
             if hasattr(e, 'response') and e.response is not None:
@@ -178,35 +259,20 @@ def main():
         st.session_state.conversation_history.append(
             AIMessage(content=initial_message))
 
-    # Display conversation
-    for message in st.session_state.conversation_history:
-        if isinstance(message, HumanMessage):
-            st.chat_message("user").write(message.content)
-        else:
-            st.chat_message("assistant").write(message.content)
-
-    # Get user input
-    user_input = st.chat_input("Type your message here...")
-
-    if user_input:
-        # Add user message to UI immediately
-        st.chat_message("user").write(user_input)
-
-        with st.spinner("Thinking..."):
-            try:
-                response, updated_history = process_user_input(
-                    user_input, st.session_state.conversation_history
-                )
-                # Update conversation history
-                st.session_state.conversation_history = updated_history
-                # Display assistant response
-                st.chat_message("assistant").write(response)
-            except Exception as e:
-                logger.error(f"Error processing input: {str(e)}")
-                st.error(f"An error occurred: {str(e)}")
-
-        # Rerun to refresh the UI
-        st.rerun()
+    # Display conversation drawn so far; new messages are drawn by the chat fragment
+    render_history()
+
+    # Each EDP cohort or centre gets its own fair share of the LLM, e.g. ?cohort=centre-a
+    tenant = st.query_params.get("cohort", DEFAULT_TENANT)
+
+    def respond(user_input):
+        _, updated_history = process_user_input(
+            user_input, st.session_state.conversation_history, tenant
+        )
+        st.session_state.conversation_history = updated_history
+
+    chat_panel("Type your message here...", "Thinking...", respond)
+    report_jobs_panel(get_report_queue())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,393 @@
+import os
+import uuid
+import heapq
+import asyncio
+import sqlite3
+import logging
+import itertools
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Priority classes, served strictly in this order
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+DEFAULT_TENANT = "default"
+
+# Upper bounds (seconds) of the wait-time histogram buckets
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Slots shared by every process using the same database; empty to disable
+LLM_SCHEDULER_DB = os.environ.get("LLM_SCHEDULER_DB", "data/llm_scheduler.db")
+SHARED_LEASE_SECONDS = 60  # a shared slot not renewed by then is assumed lost
+SHARED_POLL_INTERVAL = 0.05  # seconds between attempts to take a shared slot
+
+BUSY_MESSAGE = "The advisor is handling a lot of requests right now. Please try again in a moment."
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a request is refused because its queue is already too deep"""
+
+
+class _Waiter:
+    """A queued request, woken either as a thread or as an asyncio task"""
+
+    def __init__(self, tenant, priority, finish, loop=None):
+        self.tenant = tenant
+        self.priority = priority
+        self.finish = finish
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+        self.event = threading.Event()
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+
+    def wake(self):
+        self.event.set()
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class SharedSlots:
+    """Upstream LLM slots counted across processes in a SQLite database.
+
+    The API server and every Streamlit advisor run their own ``LLMScheduler``,
+    which orders only that process's callers. A call granted locally must also
+    insert a row here, and at most ``max_concurrency`` rows, of which at most
+    ``max_batch_concurrency`` batch, may exist at once, so the limits hold for
+    all processes together. Rows are leased and renewed by a background thread
+    while held; the slots of a process that died are freed when they expire.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS slots (
+        id TEXT PRIMARY KEY,
+        tenant TEXT NOT NULL,
+        priority INTEGER NOT NULL,
+        lease_expires_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, db_path, max_concurrency, max_batch_concurrency):
+        self.db_path = db_path
+        self.max_concurrency = max_concurrency
+        self.max_batch_concurrency = max_batch_concurrency
+        self.lock = threading.Lock()
+        self.held = set()
+        self.renewer = None
+        self.created = False
+
+    @contextmanager
+    def _connect(self):
+        if not self.created:
+            # Created on first use, so importing an advisor touches no files
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            if not self.created:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(self.SCHEMA)
+                self.created = True
+            yield conn
+        finally:
+            conn.close()
+
+    def try_acquire(self, tenant, priority):
+        """Take a slot if one is free for this priority; return its id or None"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM slots WHERE lease_expires_at < ?", (now,))
+                running = dict(conn.execute(
+                    "SELECT priority, COUNT(*) FROM slots GROUP BY priority").fetchall())
+                if (sum(running.values()) >= self.max_concurrency
+                        or (priority == BATCH and running.get(BATCH, 0) >= self.max_batch_concurrency)):
+                    conn.execute("COMMIT")
+                    return None
+                slot_id = uuid.uuid4().hex
+                conn.execute("INSERT INTO slots (id, tenant, priority, lease_expires_at) "
+                             "VALUES (?, ?, ?, ?)", (slot_id, tenant, priority, now + SHARED_LEASE_SECONDS))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        with self.lock:
+            self.held.add(slot_id)
+            if self.renewer is None:
+                self.renewer = threading.Thread(target=self._renew, name="llm-slot-renewer", daemon=True)
+                self.renewer.start()
+        return slot_id
+
+    def release(self, slot_id):
+        with self.lock:
+            self.held.discard(slot_id)
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM slots WHERE id = ?", (slot_id,))
+        except sqlite3.Error as e:
+            # The slot is freed when its lease expires
+            logger.error(f"Error releasing shared LLM slot: {str(e)}")
+
+    def _renew(self):
+        while True:
+            time.sleep(SHARED_LEASE_SECONDS / 3)
+            with self.lock:
+                held = list(self.held)
+            if not held:
+                continue
+            placeholders = ", ".join("?" for _ in held)
+            try:
+                with self._connect() as conn:
+                    conn.execute(f"UPDATE slots SET lease_expires_at = ? WHERE id IN ({placeholders})",
+                                 (time.time() + SHARED_LEASE_SECONDS, *held))
+            except sqlite3.Error as e:
+                logger.error(f"Error renewing shared LLM slots: {str(e)}")
+
+    def running(self):
+        """Live slots by priority across all processes"""
+        with self._connect() as conn:
+            return dict(conn.execute(
+                "SELECT priority, COUNT(*) FROM slots WHERE lease_expires_at >= ? "
+                "GROUP BY priority", (time.time(),)).fetchall())
+
+
+class LLMScheduler:
+    """Weighted fair scheduler for concurrent calls to the upstream LLM.
+
+    At most ``max_concurrency`` calls run at once, and batch reports may hold
+    at most ``max_batch_concurrency`` of them so slots stay free for chat even
+    while long reports are running. Waiting calls are queued per priority
+    class; interactive chat is always dispatched before batch reports. Within
+    a class, tenants (EDP cohorts or centres) share the slots by weighted fair
+    queuing: each request gets a virtual finish time of
+    ``max(class virtual time, tenant's last finish) + cost / weight`` and the
+    smallest finish time runs next, so a tenant with a long backlog cannot
+    starve the others. Requests beyond ``max_queue_depth`` for their class, or
+    ``max_tenant_depth`` for their tenant, raise ``SchedulerOverloaded``.
+
+    With ``shared`` (a ``SharedSlots``), a granted call also waits for a slot
+    shared with the other processes before it runs, so the concurrency limits
+    apply across the API server and the Streamlit advisors together. Ordering
+    and queue limits stay per process.
+    """
+
+    def __init__(self, max_concurrency=4, max_batch_concurrency=None, tenant_weights=None,
+                 max_queue_depth=None, max_tenant_depth=20, shared=None):
+        self.max_concurrency = max_concurrency
+        if max_batch_concurrency is None:
+            max_batch_concurrency = max(1, max_concurrency // 2)
+        self.max_batch_concurrency = max_batch_concurrency
+        self.tenant_weights = tenant_weights or {}
+        self.max_queue_depth = max_queue_depth or {INTERACTIVE: 200, BATCH: 50}
+        self.max_tenant_depth = max_tenant_depth
+        self.shared = shared
+        self.lock = threading.Lock()
+        self.sequence = itertools.count()
+        self.running = {priority: 0 for priority in PRIORITY_NAMES}
+        self.queues = {priority: [] for priority in PRIORITY_NAMES}
+        self.depth = {priority: 0 for priority in PRIORITY_NAMES}
+        self.virtual_time = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self.last_finish = {}
+        self.tenant_depth = {}
+        self.histograms = {}
+        self.rejected = {}
+
+    @classmethod
+    def from_env(cls):
+        """Build the scheduler from LLM_* environment variables.
+
+        ``LLM_TENANT_WEIGHTS`` is a comma separated list like ``"centre-a=2,centre-b=1"``.
+        Slots are shared through ``LLM_SCHEDULER_DB`` unless it is set empty.
+        """
+        weights = {}
+        for entry in os.environ.get("LLM_TENANT_WEIGHTS", "").split(","):
+            if "=" in entry:
+                tenant, weight = entry.split("=", 1)
+                weights[tenant.strip()] = float(weight)
+        max_concurrency = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))
+        max_batch_concurrency = int(os.environ.get(
+            "LLM_MAX_BATCH_CONCURRENCY", max(1, max_concurrency // 2)))
+        return cls(
+            max_concurrency=max_concurrency,
+            max_batch_concurrency=max_batch_concurrency,
+            tenant_weights=weights,
+            max_queue_depth={
+                INTERACTIVE: int(os.environ.get("LLM_MAX_INTERACTIVE_QUEUE", "200")),
+                BATCH: int(os.environ.get("LLM_MAX_BATCH_QUEUE", "50")),
+            },
+            max_tenant_depth=int(os.environ.get("LLM_MAX_TENANT_QUEUE", "20")),
+            shared=SharedSlots(LLM_SCHEDULER_DB, max_concurrency, max_batch_concurrency)
+            if LLM_SCHEDULER_DB else None,
+        )
+
+    def _submit(self, tenant, priority, cost=1.0, loop=None):
+        key = (priority, tenant)
+        with self.lock:
+            if (self.depth[priority] >= self.max_queue_depth[priority]
+                    or self.tenant_depth.get(key, 0) >= self.max_tenant_depth):
+                self.rejected[key] = self.rejected.get(key, 0) + 1
+                raise SchedulerOverloaded(
+                    f"Too many queued {PRIORITY_NAMES[priority]} LLM requests for {tenant}")
+
+            start = max(self.virtual_time[priority], self.last_finish.get(key, 0.0))
+            finish = start + cost / self.tenant_weights.get(tenant, 1.0)
+            self.last_finish[key] = finish
+            waiter = _Waiter(tenant, priority, finish, loop)
+            heapq.heappush(self.queues[priority], (finish, next(self.sequence), waiter))
+            self.depth[priority] += 1
+            self.tenant_depth[key] = self.tenant_depth.get(key, 0) + 1
+            self._dispatch()
+        return waiter
+
+    def _dispatch(self):
+        # Caller holds self.lock
+        while sum(self.running.values()) < self.max_concurrency:
+            limits = {INTERACTIVE: self.max_concurrency, BATCH: self.max_batch_concurrency}
+            priority = next((p for p in sorted(self.queues)
+                             if self.queues[p] and self.running[p] < limits[p]), None)
+            if priority is None:
+                return
+            finish, _, waiter = heapq.heappop(self.queues[priority])
+            if waiter.cancelled:
+                continue
+            self._dequeued(waiter)
+            self.virtual_time[priority] = finish
+            self.running[priority] += 1
+            waiter.granted = True
+            self._record_wait(waiter, time.monotonic() - waiter.enqueued_at)
+            waiter.wake()
+
+    def _dequeued(self, waiter):
+        key = (waiter.priority, waiter.tenant)
+        self.depth[waiter.priority] -= 1
+        self.tenant_depth[key] -= 1
+
+    def _record_wait(self, waiter, wait):
+        key = (waiter.tenant, waiter.priority)
+        histogram = self.histograms.setdefault(
+            key, {"buckets": [0] * (len(WAIT_BUCKETS) + 1), "count": 0, "sum": 0.0})
+        bucket = next((i for i, bound in enumerate(WAIT_BUCKETS) if wait <= bound),
+                      len(WAIT_BUCKETS))
+        histogram["buckets"][bucket] += 1
+        histogram["count"] += 1
+        histogram["sum"] += wait
+
+    def _release(self, priority):
+        with self.lock:
+            self.running[priority] -= 1
+            self._dispatch()
+
+    def _cancel(self, waiter):
+        """Withdraw a waiter, giving its slot back if it was granted meanwhile"""
+        with self.lock:
+            if waiter.granted:
+                self.running[waiter.priority] -= 1
+                self._dispatch()
+            elif not waiter.cancelled:
+                # Left in the heap and skipped when it reaches the front
+                waiter.cancelled = True
+                self._dequeued(waiter)
+
+    def _acquire_shared(self, tenant, priority):
+        """Block until a slot shared with the other processes is free"""
+        while True:
+            slot_id = self.shared.try_acquire(tenant, priority)
+            if slot_id is not None:
+                return slot_id
+            time.sleep(SHARED_POLL_INTERVAL)
+
+    async def _async_acquire_shared(self, tenant, priority):
+        """Wait for a shared slot without blocking the event loop"""
+        while True:
+            attempt = asyncio.ensure_future(asyncio.to_thread(self.shared.try_acquire, tenant, priority))
+            try:
+                slot_id = await asyncio.shield(attempt)
+            except asyncio.CancelledError:
+                # The attempt still finishes in its thread; give back what it took
+                attempt.add_done_callback(self._release_abandoned)
+                raise
+            if slot_id is not None:
+                return slot_id
+            await asyncio.sleep(SHARED_POLL_INTERVAL)
+
+    def _release_abandoned(self, attempt):
+        if not attempt.cancelled() and attempt.exception() is None and attempt.result():
+            self.shared.release(attempt.result())
+
+    @contextmanager
+    def slot(self, tenant=DEFAULT_TENANT, priority=INTERACTIVE, cost=1.0):
+        """Block the calling thread until an LLM slot is granted"""
+        waiter = self._submit(tenant, priority, cost)
+        waiter.event.wait()
+        try:
+            slot_id = self._acquire_shared(tenant, priority) if self.shared else None
+            try:
+                yield
+            finally:
+                if slot_id:
+                    self.shared.release(slot_id)
+        finally:
+            self._release(priority)
+
+    @asynccontextmanager
+    async def async_slot(self, tenant=DEFAULT_TENANT, priority=INTERACTIVE, cost=1.0):
+        """Wait for an LLM slot without blocking the event loop"""
+        waiter = self._submit(tenant, priority, cost, asyncio.get_running_loop())
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            self._cancel(waiter)
+            raise
+        try:
+            slot_id = await self._async_acquire_shared(tenant, priority) if self.shared else None
+            try:
+                yield
+            finally:
+                if slot_id:
+                    await asyncio.to_thread(self.shared.release, slot_id)
+        finally:
+            self._release(priority)
+
+    def metrics(self):
+        """Queue depths, rejections and per-tenant wait-time histograms"""
+        with self.lock:
+            tenants = {}
+            for (tenant, priority), histogram in self.histograms.items():
+                bounds = [str(bound) for bound in WAIT_BUCKETS] + ["+Inf"]
+                tenants.setdefault(tenant, {})[PRIORITY_NAMES[priority]] = {
+                    "buckets": dict(zip(bounds, itertools.accumulate(histogram["buckets"]))),
+                    "count": histogram["count"],
+                    "sum": histogram["sum"],
+                }
+            metrics = {
+                "running": {PRIORITY_NAMES[p]: count for p, count in self.running.items()},
+                "max_concurrency": self.max_concurrency,
+                "max_batch_concurrency": self.max_batch_concurrency,
+                "queued": {PRIORITY_NAMES[p]: depth for p, depth in self.depth.items()},
+                "rejected": {f"{tenant}/{PRIORITY_NAMES[p]}": count
+                             for (p, tenant), count in self.rejected.items()},
+                "wait_seconds": tenants,
+            }
+        if self.shared is not None:
+            # Calls running in every process sharing the slots, this one included
+            running = self.shared.running()
+            metrics["shared_running"] = {name: running.get(p, 0) for p, name in PRIORITY_NAMES.items()}
+        return metrics
+
+
+# Shared by every advisor running in this process
+scheduler = LLMScheduler.from_env()
@@ -1,18 +1,30 @@
 import os
+import time
+import asyncio
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, WebSocket
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from langchain.chains import ConversationalRetrievalChain, ConversationChain
 from langchain_community.chat_models import ChatPerplexity
 from langchain.memory import ConversationBufferMemory
-from market_analysis import MarketAnalysisAgent
-from gap_analysiss import gap_analysis_endpoint
+from gap_analysiss import setup_chain as setup_gap_chain, astream_swot_analysis, run_swot_job
+from gap_analysiss import export_swot_job
+from gap_analysiss import format_conversation_for_api
+from market_analysis import setup_chain as setup_market_chain, astream_market_analysis
+from market_analysis import run_market_job
+from langchain_core.messages import HumanMessage, messages_from_dict
+from report_jobs import JobQueue, WorkerPool, payload_key, FINISHED_STATUSES, POLL_INTERVAL
+from llm_scheduler import scheduler, SchedulerOverloaded, INTERACTIVE, DEFAULT_TENANT
+from swot_analytics import SwotAnalyticsStore, SWOT_REPORTS_PATH, export_swot_report
+from chat_socket import ChatSession
 from pydantic import BaseModel
 
 load_dotenv()
 
 perplexity_api_key = os.environ.get("PERPLEXITY_API_KEY")
+swot_analytics_dir = os.environ.get("SWOT_ANALYTICS_DIR", "data/swot_analytics")
 
 # Initialize FastAPI
 app = FastAPI()
@@ -31,6 +43,7 @@ app.add_middleware(
 
 class ChatRequest(BaseModel):
     message: str
+    cohort: str = DEFAULT_TENANT
 
 
 class MarketAnalysisRequest(BaseModel):
@@ -42,6 +55,12 @@ class GapAnalysisRequest(BaseModel):
     conversation_history: list = None
 
 
+class ReportJobRequest(BaseModel):
+    conversation_history: list  # messages serialized with messages_to_dict
+    idempotency_key: str = None
+    cohort: str = DEFAULT_TENANT
+
+
 # Initialize AI Model
 llm = ChatPerplexity(
     api_key=perplexity_api_key,
@@ -56,5 +75,146 @@ chat_chain = ConversationChain(llm=llm, memory=memory)
 
 @app.post("/chat")
 async def chat(request: ChatRequest):
-    response = chat_chain.run(request.message)
+    try:
+        async with scheduler.async_slot(request.cohort, INTERACTIVE):
+            response = await run_in_threadpool(chat_chain.run, request.message)
+    except SchedulerOverloaded as e:
+        raise HTTPException(status_code=429, detail=str(e))
     return {"response": response}
+
+
+# Streaming advisors for the WebSocket channel
+
+
+async def stream_chat(history, message, tenant):
+    async with scheduler.async_slot(tenant, INTERACTIVE):
+        async for chunk in llm.astream(history + [HumanMessage(content=message)]):
+            yield chunk.content
+
+
+async def stream_gap_analysis(history, message, tenant):
+    if "GENERATE_SWOT" in message.upper():
+        # Streamed on the event loop, so a report waiting for a batch slot holds no thread
+        parts = []
+        async for token in astream_swot_analysis(history + [HumanMessage(content=message)], tenant):
+            parts.append(token)
+            yield token
+        await run_in_threadpool(export_swot_report, "".join(parts), tenant)
+        return
+    chain = setup_gap_chain()
+    async with scheduler.async_slot(tenant, INTERACTIVE):
+        async for token in chain.astream({
+            "input": message,
+            "history": format_conversation_for_api(history)
+        }):
+            yield token
+
+
+async def stream_market_analysis(history, message, tenant):
+    if "GENERATE_MARKET_ANALYSIS" in message.upper():
+        async for token in astream_market_analysis(history + [HumanMessage(content=message)], tenant):
+            yield token
+        return
+    chain = setup_market_chain()
+    async with scheduler.async_slot(tenant, INTERACTIVE):
+        async for token in chain.astream({
+            "input": message,
+            "history": format_conversation_for_api(history)
+        }):
+            yield token
+
+
+advisor_streamers = {
+    "chat": stream_chat,
+    "gap": stream_gap_analysis,
+    "market": stream_market_analysis,
+}
+
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket, cohort: str = DEFAULT_TENANT):
+    await ChatSession(websocket, advisor_streamers, tenant=cohort).run()
+
+
+# Cohort analytics over the SWOT reports exported as they are generated
+swot_store = SwotAnalyticsStore(SWOT_REPORTS_PATH, swot_analytics_dir)
+
+
+# Plain def handlers: FastAPI runs them in its thread pool, keeping file and
+# Parquet I/O off the event loop that carries the chat streams
+
+
+@app.post("/analytics/swot/refresh")
+def refresh_swot_analytics():
+    ingested = swot_store.refresh()
+    return {"ingested": ingested, "total_reports": swot_store.state["reports"]}
+
+
+@app.get("/analytics/swot/top-weaknesses")
+def top_weaknesses(limit: int = 10):
+    swot_store.refresh()
+    return {"weaknesses": swot_store.top_tags("weaknesses", limit)}
+
+
+@app.get("/analytics/swot/gaps")
+def gap_frequencies(cohort: str = None, start_date: str = None, end_date: str = None):
+    swot_store.refresh()
+    return {"gaps": swot_store.gap_frequencies(cohort, start_date, end_date)}
+
+
+# Background report generation
+report_queue = JobQueue()
+report_workers = WorkerPool(report_queue, {
+    "swot": run_swot_job,
+    "market": run_market_job,
+}, on_complete={"swot": export_swot_job})
+
+
+@app.on_event("startup")
+async def start_report_workers():
+    report_workers.start()
+
+
+@app.on_event("shutdown")
+async def stop_report_workers():
+    report_workers.stop(timeout=5)
+
+
+@app.post("/reports/{kind}")
+async def enqueue_report(kind: str, request: ReportJobRequest):
+    if kind not in report_workers.handlers:
+        raise HTTPException(status_code=404, detail=f"Unknown report type: {kind}")
+    try:
+        # Reject a history the workers could not read before it is queued
+        messages_from_dict(request.conversation_history)
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid conversation_history: {str(e)}")
+    payload = {"conversation_history": request.conversation_history, "tenant": request.cohort}
+    key = request.idempotency_key or payload_key(kind, payload)
+    job_id = await run_in_threadpool(report_queue.enqueue, kind, payload, key)
+    return {"job_id": job_id}
+
+
+@app.get("/reports/jobs/{job_id}")
+async def report_status(job_id: str, wait: float = 0):
+    # wait > 0 long-polls until the job finishes or the timeout elapses. The
+    # pauses are awaited, so a waiting client only holds a thread for each get()
+    deadline = time.monotonic() + min(wait, 60)
+    job = await run_in_threadpool(report_queue.get, job_id)
+    while job and job["status"] not in FINISHED_STATUSES and time.monotonic() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+        job = await run_in_threadpool(report_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job.pop("payload", None)
+    return job
+
+
+@app.get("/reports/metrics")
+async def report_metrics():
+    return await run_in_threadpool(report_queue.metrics)
+
+
+@app.get("/llm/metrics")
+async def llm_metrics():
+    return scheduler.metrics()
@@ -3,9 +3,14 @@ import os
 import logging
 from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import messages_to_dict, messages_from_dict
 from langchain_community.chat_models import ChatPerplexity
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
+from chat_rendering import render_history, chat_panel, report_jobs_panel
+from report_jobs import JobQueue, payload_key
+from llm_scheduler import scheduler, SchedulerOverloaded, INTERACTIVE, BATCH, DEFAULT_TENANT
+from llm_scheduler import BUSY_MESSAGE
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -73,21 +78,13 @@ def setup_chain():
         return None
 
 
-def generate_market_analysis(conversation_history):
-    """Generate a Market Analysis based on conversation history"""
-    try:
-        # Initialize the model
-        llm = ChatPerplexity(
-            api_key=perplexity_api_key,
-            temperature=0.2,
-            model="sonar-pro",
-        )
+def market_messages(conversation_history):
+    """Conversation history with the market analysis instructions in front, as sent to the LLM"""
+    # Format the conversation history for the API
+    formatted_history = format_conversation_for_api(conversation_history)
 
-        # Format the conversation history for the API
-        formatted_history = format_conversation_for_api(conversation_history)
-
-        # Market analysis system message detailing the expected output
-        market_system = SystemMessage(content="""
+    # Market analysis system message detailing the expected output
+    market_system = SystemMessage(content="""
 You are an expert market analyst specializing in Indian startup initiatives and global industry insights. Your role is to assist users by providing a comprehensive market analysis tailored to their business idea or query. You must address the following aspects in detail:
 
 1. **Industry Research**:
@@ -142,12 +139,48 @@ You are an expert market analyst specializing in Indian startup initiatives and
 Always strive to deliver actionable insights that empower users to make informed decisions about their business ventures.
 """)
 
-        # Insert the market system message at the beginning of the conversation history
-        formatted_history.insert(0, market_system)
+    # Insert the market system message at the beginning of the conversation history
+    formatted_history.insert(0, market_system)
+
+    return formatted_history
+
+
+def invoke_market_analysis(conversation_history, tenant=DEFAULT_TENANT):
+    """Call the LLM for a market analysis, letting any error propagate"""
+    # Initialize the model
+    llm = ChatPerplexity(
+        api_key=perplexity_api_key,
+        temperature=0.2,
+        model="sonar-pro",
+    )
+
+    # Use the LLM directly with the properly formatted messages
+    with scheduler.slot(tenant, BATCH):
+        return llm.invoke(market_messages(conversation_history)).content
+
+
+async def astream_market_analysis(conversation_history, tenant=DEFAULT_TENANT):
+    """Stream the market analysis from the LLM without blocking a thread, letting any error propagate"""
+    # Initialize the model
+    llm = ChatPerplexity(
+        api_key=perplexity_api_key,
+        temperature=0.2,
+        model="sonar-pro",
+    )
+
+    async with scheduler.async_slot(tenant, BATCH):
+        async for chunk in llm.astream(market_messages(conversation_history)):
+            yield chunk.content
+
+
+def generate_market_analysis(conversation_history, tenant=DEFAULT_TENANT):
+    """Generate a Market Analysis based on conversation history"""
+    try:
+        return invoke_market_analysis(conversation_history, tenant)
 
-        # Use the LLM directly with the properly formatted messages
-        market_analysis = llm.invoke(formatted_history).content
-        return market_analysis
+    except SchedulerOverloaded as e:
+        logger.warning(f"Rejected report request: {str(e)}")
+        return BUSY_MESSAGE
 
     except Exception as e:
         logger.error(f"Error generating Market Analysis: {str(e)}")
@@ -156,37 +189,76 @@ Always strive to deliver actionable insights that empower users to make informed
         return f"I'm sorry, I couldn't generate a Market Analysis due to an error: {str(e)}"
 
 
-def process_user_input(user_input, conversation_history=None):
+def run_market_job(payload):
+    """Report worker entry point for queued market analysis jobs"""
+    # Errors, including SchedulerOverloaded, must reach the worker pool so the
+    # job is deferred, retried or marked failed
+    return invoke_market_analysis(
+        messages_from_dict(payload["conversation_history"]),
+        payload.get("tenant", DEFAULT_TENANT))
+
+
+@st.cache_resource
+def get_report_queue():
+    """Open the report job queue; its workers run in the API server (main.py)"""
+    return JobQueue()
+
+
+def enqueue_market_job(conversation_history, tenant=DEFAULT_TENANT):
+    """Queue a market analysis report and return its job id"""
+    payload = {
+        "conversation_history": messages_to_dict(conversation_history),
+        "tenant": tenant,
+    }
+    return get_report_queue().enqueue("market", payload, payload_key("market", payload))
+
+
+def process_user_input(user_input, conversation_history=None, tenant=DEFAULT_TENANT):
     """Process user input and generate an appropriate response for Market Analysis"""
     try:
         chain = setup_chain()
-        if chain is None:
-            return "Sorry, there was an error setting up the AI. Please try again.", conversation_history
-
         if conversation_history is None:
             conversation_history = []
 
+        if chain is None:
+            error_msg = "Sorry, there was an error setting up the AI. Please try again."
+            conversation_history.append(HumanMessage(content=user_input))
+            conversation_history.append(AIMessage(content=error_msg))
+            return error_msg, conversation_history
+
         # Append new input from the user
         conversation_history.append(HumanMessage(content=user_input))
 
         # Check if the user explicitly requests market analysis via a trigger keyword
         if "GENERATE_MARKET_ANALYSIS" in user_input.upper():
-            analysis = generate_market_analysis(conversation_history)
-            conversation_history.append(AIMessage(content=analysis))
-            return analysis, conversation_history
+            # Generate in the background so the page stays responsive
+            job_id = enqueue_market_job(conversation_history, tenant)
+            message = "Your market analysis report is being generated. It will appear here as soon as it is ready."
+            # The finished report replaces this placeholder in the conversation
+            st.session_state.setdefault("report_jobs", []).append(
+                {"job_id": job_id, "message_index": len(conversation_history)})
+            conversation_history.append(AIMessage(content=message))
+            return message, conversation_history
 
         # Otherwise, generate a typical response while maintaining conversation history
         formatted_history = format_conversation_for_api(
             conversation_history[:-1])  # Exclude current input
 
         try:
-            response = chain.invoke({
-                "input": user_input,
-                "history": formatted_history
-            })
+            with scheduler.slot(tenant, INTERACTIVE):
+                response = chain.invoke({
+                    "input": user_input,
+                    "history": formatted_history
+                })
             conversation_history.append(AIMessage(content=response))
             return response, conversation_history
 
+        except SchedulerOverloaded as e:
+            logger.warning(f"Rejected chat request: {str(e)}")
+            error_msg = BUSY_MESSAGE
+            conversation_history.append(AIMessage(content=error_msg))
+            return error_msg, conversation_history
+
         except Exception as e:
             logger.error(f"Error processing chain.invoke: {str(e)}")
             if hasattr(e, 'response') and e.response is not None:
@@ -212,29 +284,20 @@ def main():
         st.session_state.conversation_history.append(
             AIMessage(content=initial_message))
 
-    # Display the current conversation
-    for message in st.session_state.conversation_history:
-        if isinstance(message, HumanMessage):
-            st.chat_message("user").write(message.content)
-        else:
-            st.chat_message("assistant").write(message.content)
-
-    # Accept new user input from a chat box
-    user_input = st.chat_input("Type your message here...")
-    if user_input:
-        # Immediately show the user's input in the interface
-        st.chat_message("user").write(user_input)
-        with st.spinner("Analyzing market data..."):
-            try:
-                response, updated_history = process_user_input(
-                    user_input, st.session_state.conversation_history
-                )
-                st.session_state.conversation_history = updated_history
-                st.chat_message("assistant").write(response)
-            except Exception as e:
-                logger.error(f"Error processing input: {str(e)}")
-                st.error(f"An error occurred: {str(e)}")
-        st.rerun()
+    # Display the current conversation; new messages are drawn by the chat fragment
+    render_history()
+
+    # Each EDP cohort or centre gets its own fair share of the LLM, e.g. ?cohort=centre-a
+    tenant = st.query_params.get("cohort", DEFAULT_TENANT)
+
+    def respond(user_input):
+        _, updated_history = process_user_input(
+            user_input, st.session_state.conversation_history, tenant
+        )
+        st.session_state.conversation_history = updated_history
+
+    chat_panel("Type your message here...", "Analyzing market data...", respond)
+    report_jobs_panel(get_report_queue())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,342 @@
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from llm_scheduler import SchedulerOverloaded
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REPORT_QUEUE_PATH = os.environ.get("REPORT_QUEUE_PATH", "data/report_jobs.db")
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", "2"))
+
+LEASE_SECONDS = 300  # a running job not renewed by then is assumed lost
+LEASE_RENEW_INTERVAL = LEASE_SECONDS / 3  # how often a busy worker extends its lease
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 30  # seconds before a failed attempt is retried, doubled per attempt
+DEFER_DELAY = 10  # base seconds before a job refused by the LLM scheduler is retried
+POLL_INTERVAL = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    idempotency_key TEXT UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_expires_at REAL,
+    available_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+FINISHED_STATUSES = ("done", "failed")
+
+
+def payload_key(kind, payload):
+    """Idempotency key derived from the report kind and its exact input"""
+    content = json.dumps({"kind": kind, "payload": payload}, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class JobQueue:
+    """Durable report job queue stored in a local SQLite database.
+
+    Jobs move from ``queued`` to ``running`` to ``done`` or ``failed``. A
+    claimed job holds a lease that its worker renews while it runs; if the
+    worker dies the lease expires and the job is requeued. Only the worker
+    holding the lease can finish a job. A job whose attempt raised is retried
+    after a growing delay, and fails for good after ``MAX_ATTEMPTS`` attempts.
+    """
+
+    def __init__(self, db_path=REPORT_QUEUE_PATH):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "available_at" not in columns:
+                # Queues created before retries were delayed
+                conn.execute("ALTER TABLE jobs ADD COLUMN available_at REAL")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, kind, payload, idempotency_key=None):
+        """Add a job and return its id, or the id of the job already holding the key.
+
+        A failed job holding the key is queued again with fresh attempts, so
+        retrying the same request does not keep returning the old failure.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR IGNORE INTO jobs (id, kind, idempotency_key, payload, status, created_at) "
+                    "VALUES (?, ?, ?, ?, 'queued', ?)",
+                    (job_id, kind, idempotency_key, json.dumps(payload), now))
+                if idempotency_key is not None:
+                    row = conn.execute("SELECT id, status FROM jobs WHERE idempotency_key = ?",
+                                       (idempotency_key,)).fetchone()
+                    job_id = row["id"]
+                    if row["status"] == "failed":
+                        conn.execute(
+                            "UPDATE jobs SET kind = ?, payload = ?, status = 'queued', result = NULL, "
+                            "error = NULL, attempts = 0, worker_id = NULL, created_at = ?, "
+                            "started_at = NULL, finished_at = NULL, lease_expires_at = NULL, "
+                            "available_at = NULL WHERE id = ?",
+                            (kind, json.dumps(payload), now, job_id))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim(self, worker_id, kinds):
+        """Atomically take the oldest queued job of the given kinds that is due"""
+        placeholders = ", ".join("?" for _ in kinds)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT * FROM jobs WHERE status = 'queued' AND kind IN ({placeholders}) "
+                    "AND (available_at IS NULL OR available_at <= ?) "
+                    "ORDER BY created_at LIMIT 1", (*kinds, now)).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', worker_id = ?, started_at = ?, "
+                        "lease_expires_at = ?, attempts = attempts + 1 WHERE id = ?",
+                        (worker_id, now, now + LEASE_SECONDS, row["id"]))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def renew(self, job_id, worker_id):
+        """Extend the lease of a running job; False if the worker no longer holds it"""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time() + LEASE_SECONDS, job_id, worker_id)).rowcount == 1
+
+    def complete(self, job_id, worker_id, result):
+        """Store the result; False if the worker lost the job to another one"""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, finished_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (result, time.time(), job_id, worker_id)).rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Requeue a failed attempt with a delay, or fail the job once attempts run out.
+
+        Returns the job's new status, or None if the worker no longer held it.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT attempts FROM jobs WHERE id = ? AND worker_id = ? AND status = 'running'",
+                    (job_id, worker_id)).fetchone()
+                if row is None:
+                    status = None
+                elif row["attempts"] < MAX_ATTEMPTS:
+                    status = "queued"
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', error = ?, worker_id = NULL, "
+                        "started_at = NULL, lease_expires_at = NULL, available_at = ? WHERE id = ?",
+                        (error, now + RETRY_DELAY * 2 ** (row["attempts"] - 1), job_id))
+                else:
+                    status = "failed"
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                        (error, now, job_id))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return status
+
+    def defer(self, job_id, worker_id, delay):
+        """Put a running job back in the queue after ``delay`` without using up an attempt"""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = attempts - 1, worker_id = NULL, "
+                "started_at = NULL, lease_expires_at = NULL, available_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time() + delay, job_id, worker_id)).rowcount == 1
+
+    def recover(self):
+        """Requeue running jobs whose lease expired, e.g. after a crash"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Exceeded maximum attempts', "
+                "finished_at = ? WHERE status = 'running' AND lease_expires_at < ? "
+                "AND attempts >= ?", (now, now, MAX_ATTEMPTS))
+            recovered = conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, started_at = NULL, "
+                "lease_expires_at = NULL WHERE status = 'running' AND lease_expires_at < ?",
+                (now,)).rowcount
+        if recovered:
+            logger.info(f"Requeued {recovered} report jobs with expired leases")
+        return recovered
+
+    def metrics(self, window=3600):
+        """Queue depth by status and wait times for jobs started in the last window"""
+        now = time.time()
+        with self._connect() as conn:
+            depth = {row["status"]: row["count"] for row in conn.execute(
+                "SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")}
+            oldest = conn.execute(
+                "SELECT MIN(created_at) AS created_at FROM jobs WHERE status = 'queued'"
+            ).fetchone()["created_at"]
+            waits = sorted(row["wait"] for row in conn.execute(
+                "SELECT started_at - created_at AS wait FROM jobs "
+                "WHERE started_at IS NOT NULL AND started_at >= ?", (now - window,)))
+            runs = [row["run"] for row in conn.execute(
+                "SELECT finished_at - started_at AS run FROM jobs "
+                "WHERE status = 'done' AND finished_at >= ?", (now - window,))]
+
+        return {
+            "depth": {status: depth.get(status, 0)
+                      for status in ("queued", "running", "done", "failed")},
+            "oldest_queued_seconds": now - oldest if oldest else 0.0,
+            "wait_seconds": {
+                "count": len(waits),
+                "mean": sum(waits) / len(waits) if waits else 0.0,
+                "p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                "max": waits[-1] if waits else 0.0,
+            },
+            "run_seconds_mean": sum(runs) / len(runs) if runs else 0.0,
+        }
+
+
+class WorkerPool:
+    """Background threads executing queued jobs with the matching handler.
+
+    ``handlers`` maps a job kind to a function taking the job payload and
+    returning the report text. A handler should raise on failure rather than
+    return an error message, so the attempt is retried or the job marked failed.
+    ``SchedulerOverloaded`` instead defers the job: the LLM is saturated, so it
+    is retried after ``DEFER_DELAY`` plus jitter without counting an attempt.
+
+    ``on_complete`` optionally maps a job kind to a function called with the
+    job and its result once the result has been stored, exactly once per job.
+    """
+
+    def __init__(self, queue, handlers, size=REPORT_WORKERS, on_complete=None):
+        self.queue = queue
+        self.handlers = handlers
+        self.on_complete = on_complete or {}
+        self.size = size
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def start(self):
+        self.queue.recover()
+        for i in range(self.size):
+            thread = threading.Thread(target=self._run, name=f"report-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _run(self):
+        worker_id = f"{os.getpid()}-{threading.current_thread().name}"
+        last_recovery = time.time()
+        while not self.stopping.is_set():
+            try:
+                if time.time() - last_recovery > LEASE_SECONDS / 2:
+                    self.queue.recover()
+                    last_recovery = time.time()
+                job = self.queue.claim(worker_id, list(self.handlers))
+            except sqlite3.Error as e:
+                # A locked or briefly unavailable database must not kill the worker
+                logger.error(f"Error polling report queue: {str(e)}")
+                job = None
+            if job is None:
+                self.stopping.wait(POLL_INTERVAL)
+                continue
+
+            try:
+                with self._holding_lease(job["id"], worker_id):
+                    result = self.handlers[job["kind"]](job["payload"])
+            except SchedulerOverloaded as e:
+                logger.warning(f"Deferring report job {job['id']}: {str(e)}")
+                # Jitter keeps deferred jobs from all coming back at once
+                self.queue.defer(job["id"], worker_id, DEFER_DELAY * (1 + random.random()))
+                continue
+            except Exception as e:
+                logger.error(f"Error running report job {job['id']}: {str(e)}")
+                if self.queue.fail(job["id"], worker_id, str(e)) == "queued":
+                    logger.info(f"Report job {job['id']} will be retried")
+                continue
+            if not self.queue.complete(job["id"], worker_id, result):
+                logger.warning(f"Report job {job['id']} lost its lease; discarding this result")
+            elif job["kind"] in self.on_complete:
+                try:
+                    self.on_complete[job["kind"]](job, result)
+                except Exception as e:
+                    logger.error(f"Error after completing report job {job['id']}: {str(e)}")
+
+    @contextmanager
+    def _holding_lease(self, job_id, worker_id):
+        """Renew the job's lease in the background while the handler runs"""
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(LEASE_RENEW_INTERVAL):
+                if not self.queue.renew(job_id, worker_id):
+                    logger.warning(f"Report job {job_id} lease was taken over by another worker")
+                    return
+
+        renewer = threading.Thread(target=renew, name=f"lease-{job_id}", daemon=True)
+        renewer.start()
+        try:
+            yield
+        finally:
+            done.set()
+            renewer.join()
@@ -0,0 +1,283 @@
+import os
+import re
+import json
+import uuid
+import logging
+import threading
+from datetime import datetime, timezone
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SWOT_REPORTS_PATH = os.environ.get("SWOT_REPORTS_PATH", "data/swot_reports.jsonl")
+
+SWOT_CATEGORIES = ("strengths", "weaknesses", "opportunities", "threats")
+
+# Columnar layout of one extracted SWOT tag
+TAG_SCHEMA = pa.schema([
+    ("report_id", pa.string()),
+    ("cohort", pa.string()),
+    ("date", pa.string()),
+    ("category", pa.string()),
+    ("tag", pa.string()),
+])
+
+HEADING_PATTERN = re.compile(
+    r"^[#*\s\d.)]*(strengths?|weaknesses?|opportunities|opportunity|threats?)\b[\s*:–-]*$",
+    re.IGNORECASE)
+BULLET_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+(.*)$")
+
+
+def normalize_tag(item):
+    """Reduce a free-text SWOT bullet to a short, comparable tag"""
+    # Keep only the label part of "**Label**: explanation" style bullets
+    text = re.split(r":|\s[–—-]\s", item, maxsplit=1)[0]
+    text = re.sub(r"[*_`]", "", text).lower()
+    text = re.sub(r"[^a-z0-9&/+ ]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text[:60]
+
+
+def extract_swot_sections(report):
+    """Split a generated SWOT report into its four lists of normalized tags"""
+    sections = {category: [] for category in SWOT_CATEGORIES}
+    current = None
+    indent = None
+    for line in report.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+
+        heading = HEADING_PATTERN.match(stripped)
+        if heading:
+            name = heading.group(1).lower()
+            current = next(c for c in SWOT_CATEGORIES if c.startswith(name[:5]))
+            indent = None
+            continue
+
+        bullet = BULLET_PATTERN.match(stripped)
+        if current and bullet:
+            # Sub-bullets explain an item rather than naming a new one
+            line_indent = len(line) - len(line.lstrip())
+            if indent is None:
+                indent = line_indent
+            if line_indent > indent:
+                continue
+            tag = normalize_tag(bullet.group(1))
+            if tag and tag not in sections[current]:
+                sections[current].append(tag)
+    return sections
+
+
+def export_swot_report(report, cohort, report_id=None, path=None):
+    """Append a generated SWOT report to the JSONL export read by the analytics.
+
+    The whole line, including its trailing newline, goes out in a single
+    O_APPEND write so concurrent exporters never interleave and a reader never
+    sees a complete-looking partial record. Export errors are logged rather
+    than raised so they never cost the student their report.
+    """
+    path = path or SWOT_REPORTS_PATH
+    record = {
+        "report_id": report_id or uuid.uuid4().hex,
+        "cohort": cohort,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "report": report,
+    }
+    line = (json.dumps(record) + "\n").encode("utf-8")
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        logger.error(f"Error exporting SWOT report {record['report_id']}: {str(e)}")
+        return None
+    return record["report_id"]
+
+
+def report_date(record):
+    """ISO date of a report record; created_at may be an ISO string or epoch seconds"""
+    created_at = record.get("created_at") or record.get("date") or ""
+    if isinstance(created_at, (int, float)):
+        return datetime.fromtimestamp(created_at, timezone.utc).date().isoformat()
+    return str(created_at)[:10]
+
+
+def reports_to_table(records):
+    """Flatten exported report records into a columnar table of tags"""
+    columns = {name: [] for name in TAG_SCHEMA.names}
+    for record in records:
+        sections = extract_swot_sections(record.get("report", ""))
+        date = report_date(record)
+        for category, tags in sections.items():
+            for tag in tags:
+                columns["report_id"].append(str(record.get("report_id", "")))
+                columns["cohort"].append(str(record.get("cohort") or "unassigned"))
+                columns["date"].append(date)
+                columns["category"].append(category)
+                columns["tag"].append(tag)
+    return pa.table(columns, schema=TAG_SCHEMA)
+
+
+def count_by(table, keys):
+    """Vectorized group-by count over the given key columns"""
+    return table.group_by(keys).aggregate([("tag", "count")]).rename_columns(
+        keys + ["count"])
+
+
+def merge_counts(existing, update, keys):
+    """Fold a batch of counts into running totals without touching raw tags"""
+    if existing is None:
+        return update
+    combined = pa.concat_tables([existing, update.cast(existing.schema)])
+    return combined.group_by(keys).aggregate([("count", "sum")]).rename_columns(
+        keys + ["count"])
+
+
+class SwotAnalyticsStore:
+    """Parquet-backed store of SWOT tags with incrementally maintained aggregates.
+
+    Raw tags are appended as one Parquet part per ingested batch, and the
+    cohort aggregates are updated by merging each batch's group-by counts, so
+    a refresh only ever reads the report lines added since the previous one.
+
+    Every refresh writes a new version of the aggregate files and then swaps
+    in a state file naming that version, so the source offset and the counts
+    always advance together and a crash mid-refresh cannot double-count.
+    """
+
+    TAG_KEYS = ["category", "tag"]
+    GAP_KEYS = ["cohort", "date", "tag"]
+
+    def __init__(self, source_path, store_dir):
+        self.source_path = source_path
+        self.store_dir = store_dir
+        self.parts_dir = os.path.join(store_dir, "tags")
+        self.state_path = os.path.join(store_dir, "state.json")
+        os.makedirs(self.parts_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.state = self._load_state()
+        self.tag_counts = self._load_aggregate("tag_counts", self.state["version"])
+        self.gap_counts = self._load_aggregate("gap_counts", self.state["version"])
+
+    def _load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                return json.load(f)
+        return {"offset": 0, "parts": 0, "reports": 0, "version": 0}
+
+    def _aggregate_path(self, name, version):
+        return os.path.join(self.store_dir, f"{name}-{version:06d}.parquet")
+
+    def _load_aggregate(self, name, version):
+        path = self._aggregate_path(name, version)
+        return pq.read_table(path) if os.path.exists(path) else None
+
+    def _save(self, state, tag_counts, gap_counts):
+        """Write a new aggregate version, then commit it by replacing the state file"""
+        for name, table in (("tag_counts", tag_counts), ("gap_counts", gap_counts)):
+            if table is not None:
+                pq.write_table(table, self._aggregate_path(name, state["version"]))
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.state_path)
+
+        # Older versions are unreferenced once the new state is in place
+        for name in ("tag_counts", "gap_counts"):
+            old_path = self._aggregate_path(name, self.state["version"])
+            if os.path.exists(old_path):
+                os.remove(old_path)
+
+    def _read_new_records(self):
+        """Read complete JSONL lines appended since the last refresh"""
+        if not os.path.exists(self.source_path):
+            return [], self.state["offset"]
+
+        records = []
+        with open(self.source_path, "rb") as f:
+            f.seek(self.state["offset"])
+            offset = self.state["offset"]
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Partially written line, pick it up next time
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    logger.error(f"Skipping malformed SWOT report line: {str(e)}")
+        return records, offset
+
+    def _part_path(self, index):
+        return os.path.join(self.parts_dir, f"part-{index:06d}.parquet")
+
+    def refresh(self):
+        """Ingest newly exported reports and update the aggregates"""
+        with self.lock:
+            records, offset = self._read_new_records()
+            if offset <= self.state["offset"]:
+                return 0
+
+            state = dict(self.state, offset=offset, version=self.state["version"] + 1,
+                         reports=self.state["reports"] + len(records))
+            tag_counts, gap_counts = self.tag_counts, self.gap_counts
+            batch = reports_to_table(records)
+            if batch.num_rows:
+                # A part left behind by an interrupted refresh is simply overwritten
+                pq.write_table(batch, self._part_path(state["parts"]))
+                state["parts"] += 1
+
+                tag_counts = merge_counts(
+                    tag_counts, count_by(batch, self.TAG_KEYS), self.TAG_KEYS)
+                weaknesses = batch.filter(pc.equal(batch["category"], "weaknesses"))
+                if weaknesses.num_rows:
+                    gap_counts = merge_counts(
+                        gap_counts, count_by(weaknesses, self.GAP_KEYS), self.GAP_KEYS)
+
+            self._save(state, tag_counts, gap_counts)
+            self.state, self.tag_counts, self.gap_counts = state, tag_counts, gap_counts
+        logger.info(f"Ingested {len(records)} SWOT reports ({batch.num_rows} tags)")
+        return len(records)
+
+    def tags(self):
+        """Return every stored tag as a single table"""
+        if not self.state["parts"]:
+            return TAG_SCHEMA.empty_table()
+        return pa.concat_tables([pq.read_table(self._part_path(i), schema=TAG_SCHEMA)
+                                 for i in range(self.state["parts"])])
+
+    def top_tags(self, category="weaknesses", limit=10):
+        """Most frequent tags in a SWOT category across all cohorts"""
+        if self.tag_counts is None:
+            return []
+        table = self.tag_counts.filter(pc.equal(self.tag_counts["category"], category))
+        table = table.sort_by([("count", "descending"), ("tag", "ascending")])
+        return table.slice(0, limit).select(["tag", "count"]).to_pylist()
+
+    def gap_frequencies(self, cohort=None, start_date=None, end_date=None):
+        """Weakness tag counts grouped by cohort and date"""
+        if self.gap_counts is None:
+            return []
+        table = self.gap_counts
+        if cohort:
+            table = table.filter(pc.equal(table["cohort"], cohort))
+        if start_date:
+            table = table.filter(pc.greater_equal(table["date"], start_date))
+        if end_date:
+            table = table.filter(pc.less_equal(table["date"], end_date))
+        table = table.sort_by([("cohort", "ascending"), ("date", "ascending"),
+                               ("count", "descending")])
+        return table.to_pylist()
@@ -0,0 +1,76 @@
+from streamlit.testing.v1 import AppTest, app_test
+from langchain_core.messages import HumanMessage, AIMessage
+from benchmark_chat_rendering import FragmentScriptRunner, chat_panel_fragment_id
+from chat_rendering import FRAGMENT_BACKLOG, NO_REPLY_MESSAGE
+
+PAGE = """
+import streamlit as st
+from langchain_core.messages import HumanMessage, AIMessage
+from chat_rendering import render_history, chat_panel
+
+st.session_state.full_runs = st.session_state.get("full_runs", 0) + 1
+if "conversation_history" not in st.session_state:
+    st.session_state.conversation_history = [AIMessage(content="Welcome")]
+render_history()
+
+def respond(user_input):
+    if user_input == "fail":
+        raise RuntimeError("upstream error")
+    st.session_state.conversation_history.extend(
+        [HumanMessage(content=user_input), AIMessage(content="Re: " + user_input)])
+
+chat_panel("Type your message here...", "Thinking...", respond)
+"""
+
+
+def bubbles(at):
+    return [message.markdown[0].value for message in at.chat_message]
+
+
+def submit(at, text, above):
+    """Submit through a fragment rerun and return every chat bubble on screen.
+
+    ``above`` holds the bubbles the last full page run drew outside the
+    fragment, which the browser keeps while only the fragment is redrawn.
+    """
+    FragmentScriptRunner.fragment_id = chat_panel_fragment_id()
+    full_runs = at.session_state["full_runs"]
+    at.chat_input[0].set_value(text).run()
+    assert not at.exception
+    if at.session_state["full_runs"] == full_runs:
+        return above + bubbles(at)
+    # A backlog flush reran the whole page
+    above[:] = bubbles(at)[:at.session_state["rendered_count"]]
+    return bubbles(at)
+
+
+def test_each_message_is_drawn_once_across_fragment_reruns_and_flushes(monkeypatch):
+    monkeypatch.setattr(app_test, "LocalScriptRunner", app_test.LocalScriptRunner)
+    FragmentScriptRunner.install()
+    at = AppTest.from_string(PAGE, default_timeout=30)
+    at.run()
+    above = bubbles(at)
+    assert above == ["Welcome"]
+
+    inputs = [f"Message {i}" for i in range(FRAGMENT_BACKLOG)]
+    inputs[3] = "fail"
+    for text in inputs:
+        screen = submit(at, text, above)
+        history = at.session_state["conversation_history"]
+        assert screen == [message.content for message in history]
+
+    # The backlog was flushed into the page history along the way
+    assert at.session_state["full_runs"] > 1
+    assert at.session_state["rendered_count"] > 1
+    # A failed reply keeps the user's input in the conversation
+    history = at.session_state["conversation_history"]
+    assert [m.content for m in history[7:9]] == ["fail", NO_REPLY_MESSAGE]
+    assert isinstance(history[7], HumanMessage) and isinstance(history[8], AIMessage)
+
+
+def test_process_user_input_records_input_when_chain_is_unavailable(monkeypatch):
+    import gap_analysiss
+    monkeypatch.setattr(gap_analysiss, "setup_chain", lambda: None)
+    message, history = gap_analysiss.process_user_input("Hello", [AIMessage(content="Welcome")])
+    assert [m.content for m in history] == ["Welcome", "Hello", message]
+    assert isinstance(history[1], HumanMessage)
@@ -0,0 +1,124 @@
+import asyncio
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+import chat_socket
+from chat_socket import ChatSession, MAX_CHANNELS
+from llm_scheduler import SchedulerOverloaded, BUSY_MESSAGE
+
+
+async def echo(history, message, tenant):
+    for word in message.split():
+        await asyncio.sleep(0.01)
+        yield word + " "
+    yield f"({len(history)} earlier, {tenant})"
+
+
+async def stall(history, message, tenant):
+    yield "thinking"
+    await asyncio.sleep(30)
+
+
+async def overloaded(history, message, tenant):
+    raise SchedulerOverloaded("Too many queued batch LLM requests for c1")
+    yield
+
+
+def make_client():
+    app = FastAPI()
+
+    @app.websocket("/ws/chat")
+    async def socket(websocket: WebSocket):
+        await ChatSession(websocket, {"chat": echo, "slow": stall, "busy": overloaded}, tenant="c1").run()
+
+    return TestClient(app)
+
+
+def receive_until_done(ws, channels):
+    """Collect frames until every channel in ``channels`` has finished"""
+    frames, open_channels = [], set(channels)
+    while open_channels:
+        frame = ws.receive_json()
+        frames.append(frame)
+        if frame["type"] in ("done", "error"):
+            open_channels.discard(frame.get("channel"))
+    return frames
+
+
+def reply_text(frames, channel):
+    return "".join(f["content"] for f in frames if f["type"] == "token" and f["channel"] == channel)
+
+
+def test_channels_stream_interleaved_with_their_own_history():
+    with make_client().websocket_connect("/ws/chat") as ws:
+        ws.send_json({"type": "message", "channel": "a", "content": "one two three"})
+        ws.send_json({"type": "message", "channel": "b", "content": "four five six"})
+        frames = receive_until_done(ws, {"a", "b"})
+
+        assert reply_text(frames, "a") == "one two three (0 earlier, c1)"
+        assert reply_text(frames, "b") == "four five six (0 earlier, c1)"
+        first_done = next(i for i, f in enumerate(frames) if f["type"] == "done")
+        assert {f["channel"] for f in frames[:first_done] if f["type"] == "token"} == {"a", "b"}
+
+        ws.send_json({"type": "message", "channel": "a", "content": "again"})
+        assert reply_text(receive_until_done(ws, {"a"}), "a") == "again (2 earlier, c1)"
+
+
+def test_busy_channel_and_channel_limit_are_rejected():
+    with make_client().websocket_connect("/ws/chat") as ws:
+        for i in range(MAX_CHANNELS):
+            ws.send_json({"type": "message", "channel": f"c{i}", "advisor": "slow", "content": "x"})
+        ws.send_json({"type": "message", "channel": "c0", "content": "x"})
+        ws.send_json({"type": "message", "channel": "extra", "content": "x"})
+        ws.send_json({"type": "message", "channel": "other", "advisor": "nope", "content": "x"})
+
+        errors = [f for f in receive_until_done(ws, {"c0", "extra", "other"}) if f["type"] == "error"]
+        assert [(f["channel"], f["error"]) for f in errors] == [
+            ("c0", "A reply is already streaming on this channel"),
+            ("extra", "Too many concurrent conversations"),
+            ("other", "Unknown advisor: nope"),
+        ]
+
+
+def test_cancel_frees_the_channel():
+    with make_client().websocket_connect("/ws/chat") as ws:
+        ws.send_json({"type": "message", "channel": "a", "advisor": "slow", "content": "x"})
+        assert ws.receive_json() == {"type": "token", "channel": "a", "content": "thinking"}
+        ws.send_json({"type": "cancel", "channel": "a"})
+        ws.send_json({"type": "message", "channel": "a", "content": "hello"})
+        frames = receive_until_done(ws, {"a"})
+        assert frames[-1] == {"type": "done", "channel": "a"}
+        # A cancelled reply is not added to the channel's history
+        assert reply_text(frames, "a") == "hello (0 earlier, c1)"
+
+
+def test_overloaded_scheduler_gets_the_busy_message():
+    with make_client().websocket_connect("/ws/chat") as ws:
+        ws.send_json({"type": "message", "channel": "a", "advisor": "busy", "content": "GENERATE_SWOT"})
+        assert ws.receive_json() == {"type": "error", "channel": "a", "error": BUSY_MESSAGE}
+
+
+def test_malformed_frames_get_an_error_and_keep_the_session():
+    with make_client().websocket_connect("/ws/chat") as ws:
+        ws.send_json({"type": "message", "channel": "a", "content": "one two"})
+        ws.send_text("not json")
+        ws.send_json([1, 2])
+        ws.send_json({"type": "bogus", "channel": "b"})
+        frames = receive_until_done(ws, {"a", "b"})
+
+        errors = [f for f in frames if f["type"] == "error"]
+        assert errors == [
+            {"type": "error", "error": "Frames must be JSON objects"},
+            {"type": "error", "error": "Frames must be JSON objects"},
+            {"type": "error", "channel": "b", "error": "Unknown frame type: bogus"},
+        ]
+        # The reply already streaming on the connection was not interrupted
+        assert reply_text(frames, "a") == "one two (0 earlier, c1)"
+
+
+def test_heartbeat_pings_and_answers_pings(monkeypatch):
+    monkeypatch.setattr(chat_socket, "HEARTBEAT_INTERVAL", 0.05)
+    with make_client().websocket_connect("/ws/chat") as ws:
+        ws.send_json({"type": "ping"})
+        frames = [ws.receive_json(), ws.receive_json()]
+        assert {"type": "pong"} in frames
+        assert {"type": "ping"} in frames
@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+import pytest
+import llm_scheduler
+from llm_scheduler import LLMScheduler, SharedSlots, SchedulerOverloaded, INTERACTIVE, BATCH
+
+
+def queue_behind_blocker(scheduler, requests):
+    """Fill the only slot, then queue ``(tenant, priority)`` requests behind it"""
+    blocker = scheduler._submit("blocker", INTERACTIVE)
+    assert blocker.granted
+    return blocker, [scheduler._submit(tenant, priority) for tenant, priority in requests]
+
+
+def grant_order(scheduler, blocker, waiters):
+    """Free the slot one call at a time and return the tenants in the order they ran"""
+    order = []
+    running = blocker
+    while True:
+        scheduler._release(running.priority)
+        granted = [w for w in waiters if w.granted and w not in order]
+        if not granted:
+            return [w.tenant for w in order]
+        assert len(granted) == 1
+        running = granted[0]
+        order.append(running)
+
+
+def test_interactive_is_dispatched_before_batch():
+    scheduler = LLMScheduler(max_concurrency=1)
+    blocker, waiters = queue_behind_blocker(
+        scheduler, [("b1", BATCH), ("b2", BATCH), ("i1", INTERACTIVE)])
+    assert grant_order(scheduler, blocker, waiters) == ["i1", "b1", "b2"]
+
+
+def test_tenants_share_slots_by_weight():
+    requests = [("a", BATCH)] * 4 + [("b", BATCH)] * 2
+    scheduler = LLMScheduler(max_concurrency=1)
+    blocker, waiters = queue_behind_blocker(scheduler, requests)
+    assert grant_order(scheduler, blocker, waiters) == ["a", "b", "a", "b", "a", "a"]
+
+    scheduler = LLMScheduler(max_concurrency=1, tenant_weights={"a": 2})
+    blocker, waiters = queue_behind_blocker(scheduler, requests)
+    assert grant_order(scheduler, blocker, waiters) == ["a", "a", "b", "a", "a", "b"]
+
+
+def test_batch_cap_keeps_slots_free_for_chat():
+    scheduler = LLMScheduler(max_concurrency=4, max_batch_concurrency=2)
+    batch = [scheduler._submit("workshop", BATCH) for _ in range(4)]
+    assert [w.granted for w in batch] == [True, True, False, False]
+
+    chat = [scheduler._submit("centre", INTERACTIVE) for _ in range(2)]
+    assert all(w.granted for w in chat)
+    assert scheduler.metrics()["running"] == {"interactive": 2, "batch": 2}
+
+    scheduler._release(BATCH)
+    assert batch[2].granted and not batch[3].granted
+
+
+def test_requests_beyond_queue_limits_are_rejected():
+    scheduler = LLMScheduler(max_concurrency=1, max_tenant_depth=2,
+                             max_queue_depth={INTERACTIVE: 10, BATCH: 3})
+    queue_behind_blocker(scheduler, [("a", BATCH), ("a", BATCH)])
+    with pytest.raises(SchedulerOverloaded):
+        scheduler._submit("a", BATCH)
+
+    scheduler._submit("b", BATCH)
+    with pytest.raises(SchedulerOverloaded):
+        scheduler._submit("c", BATCH)
+    # Interactive requests are limited separately
+    scheduler._submit("a", INTERACTIVE)
+
+    metrics = scheduler.metrics()
+    assert metrics["rejected"] == {"a/batch": 1, "c/batch": 1}
+    assert metrics["queued"] == {"interactive": 1, "batch": 3}
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    scheduler = LLMScheduler(max_concurrency=1)
+
+    async def scenario():
+        async with scheduler.async_slot("a", INTERACTIVE):
+            entered = asyncio.Event()
+
+            async def wait_for_slot():
+                async with scheduler.async_slot("b", INTERACTIVE):
+                    entered.set()
+
+            task = asyncio.create_task(wait_for_slot())
+            await asyncio.sleep(0.01)
+            assert scheduler.metrics()["queued"]["interactive"] == 1
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert scheduler.metrics()["queued"]["interactive"] == 0
+        return entered.is_set()
+
+    assert asyncio.run(scenario()) is False
+    assert scheduler.metrics()["running"] == {"interactive": 0, "batch": 0}
+
+
+def test_slot_blocks_threads_until_granted():
+    scheduler = LLMScheduler(max_concurrency=1)
+    events = []
+
+    def chat():
+        with scheduler.slot("b"):
+            events.append("b ran")
+
+    with scheduler.slot("a", BATCH):
+        thread = threading.Thread(target=chat)
+        thread.start()
+        thread.join(0.1)
+        assert thread.is_alive()
+        events.append("a released")
+    thread.join(5)
+    assert events == ["a released", "b ran"]
+    assert scheduler.metrics()["wait_seconds"]["b"]["interactive"]["count"] == 1
+
+
+def test_shared_slots_limit_calls_across_schedulers(tmp_path):
+    # Two schedulers on one database stand for the API and a Streamlit advisor
+    db_path = str(tmp_path / "llm.db")
+    api, advisor = (LLMScheduler(max_concurrency=2, shared=SharedSlots(db_path, 1, 1))
+                    for _ in range(2))
+    events = []
+
+    def report():
+        with advisor.slot("b", BATCH):
+            events.append("advisor ran")
+
+    with api.slot("a"):
+        thread = threading.Thread(target=report)
+        thread.start()
+        thread.join(0.3)
+        # Granted by its own scheduler, but waiting for the shared slot
+        assert thread.is_alive()
+        assert advisor.metrics()["running"]["batch"] == 1
+        assert api.metrics()["shared_running"] == {"interactive": 1, "batch": 0}
+        events.append("api released")
+    thread.join(5)
+    assert events == ["api released", "advisor ran"]
+    assert api.metrics()["shared_running"] == {"interactive": 0, "batch": 0}
+
+
+def test_shared_slots_keep_batch_cap_and_expire_lost_slots(tmp_path, monkeypatch):
+    slots = SharedSlots(str(tmp_path / "llm.db"), 3, 1)
+    assert slots.try_acquire("a", BATCH)
+    assert slots.try_acquire("b", BATCH) is None
+    assert slots.try_acquire("b", INTERACTIVE)
+    lost = slots.try_acquire("c", INTERACTIVE)
+    assert slots.try_acquire("c", INTERACTIVE) is None
+
+    # A process that died never releases or renews its slots
+    with slots._connect() as conn:
+        conn.execute("UPDATE slots SET lease_expires_at = ? WHERE id = ?", (time.time() - 1, lost))
+    assert slots.try_acquire("c", INTERACTIVE)
+
+
+def test_cancelled_wait_for_shared_slot_frees_local_slot(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "SHARED_POLL_INTERVAL", 0.01)
+    slots = SharedSlots(str(tmp_path / "llm.db"), 1, 1)
+    held = slots.try_acquire("other process", INTERACTIVE)
+    scheduler = LLMScheduler(max_concurrency=1, shared=slots)
+
+    async def scenario():
+        async def call():
+            async with scheduler.async_slot("a"):
+                pass
+
+        task = asyncio.create_task(call())
+        await asyncio.sleep(0.1)
+        assert scheduler.metrics()["running"]["interactive"] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert scheduler.metrics()["running"] == {"interactive": 0, "batch": 0}
+    slots.release(held)
+    assert slots.running() == {}
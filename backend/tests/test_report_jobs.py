@@ -0,0 +1,253 @@
+import threading
+import time
+import report_jobs
+from llm_scheduler import SchedulerOverloaded
+from report_jobs import JobQueue, WorkerPool, payload_key, FINISHED_STATUSES, MAX_ATTEMPTS
+
+
+def make_queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"))
+
+
+def expire_lease(queue, job_id):
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET lease_expires_at = ? WHERE id = ?",
+                     (time.time() - 1, job_id))
+
+
+def make_due(queue, job_id):
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET available_at = NULL WHERE id = ?", (job_id,))
+
+
+def test_enqueue_with_same_key_returns_existing_job(tmp_path):
+    queue = make_queue(tmp_path)
+    payload = {"conversation_history": [], "tenant": "c1"}
+    first = queue.enqueue("swot", payload, payload_key("swot", payload))
+    second = queue.enqueue("swot", dict(payload), payload_key("swot", dict(payload)))
+    other = queue.enqueue("market", payload, payload_key("market", payload))
+    assert first == second
+    assert other != first
+    assert queue.metrics()["depth"]["queued"] == 2
+
+
+def test_enqueue_requeues_a_failed_job_holding_the_key(tmp_path, monkeypatch):
+    monkeypatch.setattr(report_jobs, "MAX_ATTEMPTS", 1)
+    queue = make_queue(tmp_path)
+    payload = {"conversation_history": [], "tenant": "c1"}
+    job_id = queue.enqueue("swot", payload, payload_key("swot", payload))
+    queue.claim("w1", ["swot"])
+    assert queue.fail(job_id, "w1", "upstream error") == "failed"
+
+    assert queue.enqueue("swot", payload, payload_key("swot", payload)) == job_id
+    job = queue.get(job_id)
+    assert (job["status"], job["error"], job["attempts"], job["finished_at"]) == ("queued", None, 0, None)
+    assert queue.claim("w2", ["swot"])["id"] == job_id
+
+
+def test_api_rejects_unreadable_conversation_history(tmp_path, monkeypatch):
+    # main opens its queue and analytics store under data/ when imported
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("PERPLEXITY_API_KEY", "dummy")
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    response = client.post("/reports/swot", json={"conversation_history": [{"content": "hi"}]})
+    assert response.status_code == 422
+    assert main.report_queue.metrics()["depth"].get("queued", 0) == 0
+
+    history = [{"type": "human", "data": {"content": "hi"}}]
+    response = client.post("/reports/swot", json={"conversation_history": history})
+    assert response.status_code == 200
+    assert main.report_queue.get(response.json()["job_id"])["status"] == "queued"
+
+
+def test_claim_takes_oldest_job_once(tmp_path):
+    queue = make_queue(tmp_path)
+    first = queue.enqueue("swot", {"n": 1})
+    second = queue.enqueue("swot", {"n": 2})
+    queue.enqueue("market", {"n": 3})
+
+    job = queue.claim("w1", ["swot"])
+    assert job["id"] == first
+    assert job["payload"] == {"n": 1}
+    assert job["attempts"] == 0  # row as read before the claim
+    assert queue.get(first)["status"] == "running"
+    assert queue.claim("w2", ["swot"])["id"] == second
+    assert queue.claim("w3", ["swot"]) is None
+
+
+def test_only_the_lease_holder_can_finish_a_job(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("swot", {})
+    queue.claim("w1", ["swot"])
+
+    assert not queue.complete(job_id, "w2", "stolen")
+    assert queue.fail(job_id, "w2", "boom") is None
+    assert queue.complete(job_id, "w1", "report")
+    job = queue.get(job_id)
+    assert (job["status"], job["result"]) == ("done", "report")
+    assert not queue.renew(job_id, "w1")
+
+
+def test_recover_requeues_expired_lease_and_fences_old_worker(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("swot", {})
+    queue.claim("w1", ["swot"])
+    assert queue.recover() == 0
+
+    expire_lease(queue, job_id)
+    assert queue.recover() == 1
+    assert queue.get(job_id)["status"] == "queued"
+
+    queue.claim("w2", ["swot"])
+    assert not queue.renew(job_id, "w1")
+    assert not queue.complete(job_id, "w1", "late result")
+    assert queue.complete(job_id, "w2", "report")
+
+
+def test_recover_fails_job_after_max_attempts(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("swot", {})
+    for attempt in range(MAX_ATTEMPTS):
+        queue.claim(f"w{attempt}", ["swot"])
+        expire_lease(queue, job_id)
+        queue.recover()
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert job["attempts"] == MAX_ATTEMPTS
+
+
+def test_renew_extends_lease(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("swot", {})
+    queue.claim("w1", ["swot"])
+    expire_lease(queue, job_id)
+    assert queue.renew(job_id, "w1")
+    assert queue.recover() == 0
+    assert queue.get(job_id)["status"] == "running"
+
+
+def test_fail_retries_after_delay_then_gives_up(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("swot", {})
+    for attempt in range(1, MAX_ATTEMPTS):
+        assert queue.claim("w1", ["swot"])["id"] == job_id
+        assert queue.fail(job_id, "w1", "upstream error") == "queued"
+        # Not claimable until its retry delay has passed
+        assert queue.claim("w1", ["swot"]) is None
+        make_due(queue, job_id)
+
+    queue.claim("w1", ["swot"])
+    assert queue.fail(job_id, "w1", "upstream error") == "failed"
+    job = queue.get(job_id)
+    assert (job["status"], job["error"], job["attempts"]) == ("failed", "upstream error", MAX_ATTEMPTS)
+
+
+def test_defer_requeues_without_using_an_attempt(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("swot", {})
+    queue.claim("w1", ["swot"])
+    assert not queue.defer(job_id, "w2", 10)
+    assert queue.defer(job_id, "w1", 10)
+
+    job = queue.get(job_id)
+    assert (job["status"], job["attempts"], job["worker_id"]) == ("queued", 0, None)
+    assert queue.claim("w1", ["swot"]) is None
+    make_due(queue, job_id)
+    assert queue.claim("w1", ["swot"])["id"] == job_id
+
+
+def test_worker_pool_defers_jobs_refused_by_scheduler(tmp_path, monkeypatch):
+    monkeypatch.setattr(report_jobs, "DEFER_DELAY", 60)
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("swot", {})
+    refused = threading.Event()
+
+    def overloaded(payload):
+        refused.set()
+        raise SchedulerOverloaded("Too many queued batch LLM requests")
+
+    pool = WorkerPool(queue, {"swot": overloaded}, size=1)
+    pool.start()
+    try:
+        assert refused.wait(5)
+        deadline = time.time() + 5
+        while time.time() < deadline and queue.get(job_id)["status"] == "running":
+            time.sleep(0.05)
+    finally:
+        pool.stop(timeout=5)
+
+    job = queue.get(job_id)
+    assert (job["status"], job["attempts"]) == ("queued", 0)
+    assert job["available_at"] > time.time() + 30
+
+
+def test_worker_pool_records_handler_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(report_jobs, "MAX_ATTEMPTS", 1)
+    queue = make_queue(tmp_path)
+    ok = queue.enqueue("swot", {"text": "report"})
+    broken = queue.enqueue("market", {})
+
+    def fail(payload):
+        raise RuntimeError("upstream error")
+
+    pool = WorkerPool(queue, {"swot": lambda payload: payload["text"], "market": fail}, size=1)
+    pool.start()
+    try:
+        deadline = time.time() + 10
+        while time.time() < deadline and any(
+                queue.get(job_id)["status"] not in FINISHED_STATUSES for job_id in (ok, broken)):
+            time.sleep(0.05)
+    finally:
+        pool.stop(timeout=5)
+
+    assert (queue.get(ok)["status"], queue.get(ok)["result"]) == ("done", "report")
+    assert (queue.get(broken)["status"], queue.get(broken)["error"]) == ("failed", "upstream error")
+
+
+def test_worker_pool_renews_lease_while_handler_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(report_jobs, "LEASE_RENEW_INTERVAL", 0.05)
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("swot", {})
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(payload):
+        started.set()
+        release.wait(5)
+        return "report"
+
+    pool = WorkerPool(queue, {"swot": slow}, size=1)
+    pool.start()
+    try:
+        assert started.wait(5)
+        expire_lease(queue, job_id)
+        time.sleep(0.3)
+        assert queue.get(job_id)["lease_expires_at"] > time.time()
+        assert queue.recover() == 0
+    finally:
+        release.set()
+        pool.stop(timeout=5)
+    assert queue.get(job_id)["status"] == "done"
+
+
+def test_worker_pool_runs_completion_hook_once_stored(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("swot", {"tenant": "c1"})
+    completed = []
+    done = threading.Event()
+
+    def on_complete(job, result):
+        completed.append((job["id"], job["payload"]["tenant"], result, queue.get(job["id"])["status"]))
+        done.set()
+
+    pool = WorkerPool(queue, {"swot": lambda payload: "report"}, size=1,
+                      on_complete={"swot": on_complete})
+    pool.start()
+    try:
+        assert done.wait(5)
+    finally:
+        pool.stop(timeout=5)
+    assert completed == [(job_id, "c1", "report", "done")]
@@ -0,0 +1,150 @@
+import json
+from datetime import datetime, timezone
+import pyarrow as pa
+import swot_analytics
+from swot_analytics import (SwotAnalyticsStore, extract_swot_sections, merge_counts,
+                            normalize_tag, reports_to_table)
+
+REPORT = """### 1. Strengths
+- **Domain knowledge**: Several years in retail operations
+* Network – existing supplier relationships
+
+**Weaknesses:**
+1. **Financial planning**: No cash flow projections yet
+2) Marketing
+   - nested detail about marketing
+
+Opportunities
+• Government schemes for MSMEs
+
+## Threats
+- Competition from established chains
+"""
+
+
+def write_reports(path, reports):
+    with open(path, "a") as f:
+        for report in reports:
+            f.write(json.dumps(report) + "\n")
+
+
+def test_normalize_tag_keeps_label_only():
+    assert normalize_tag("**Financial Planning**: no projections") == "financial planning"
+    assert normalize_tag("Network – existing suppliers") == "network"
+    assert normalize_tag("`E-commerce` reach!") == "e commerce reach"
+
+
+def test_extract_swot_sections_reads_headings_and_bullets():
+    sections = extract_swot_sections(REPORT)
+    assert sections["strengths"] == ["domain knowledge", "network"]
+    assert sections["weaknesses"] == ["financial planning", "marketing"]
+    assert sections["opportunities"] == ["government schemes for msmes"]
+    assert sections["threats"] == ["competition from established chains"]
+
+
+def test_extract_swot_sections_ignores_bullets_before_first_heading():
+    sections = extract_swot_sections("- stray bullet\nStrength\n- Sales")
+    assert sections["strengths"] == ["sales"]
+    assert not any(sections[c] for c in ("weaknesses", "opportunities", "threats"))
+
+
+def test_merge_counts_sums_matching_keys():
+    existing = pa.table({"tag": ["a", "b"], "count": [2, 1]})
+    update = pa.table({"tag": ["b", "c"], "count": [3, 1]})
+    merged = merge_counts(existing, update, ["tag"]).sort_by("tag").to_pylist()
+    assert merged == [{"tag": "a", "count": 2}, {"tag": "b", "count": 4},
+                      {"tag": "c", "count": 1}]
+
+
+def test_store_refresh_is_incremental(tmp_path):
+    source = tmp_path / "reports.jsonl"
+    report = {"report_id": "1", "cohort": "c1", "created_at": "2026-10-01T10:00", "report": REPORT}
+    write_reports(source, [report])
+
+    store = SwotAnalyticsStore(str(source), str(tmp_path / "store"))
+    assert store.refresh() == 1
+    assert store.refresh() == 0
+
+    write_reports(source, [dict(report, report_id="2", cohort="c2")])
+    assert store.refresh() == 1
+    assert store.top_tags("weaknesses", 1) == [{"tag": "financial planning", "count": 2}]
+    assert {row["cohort"] for row in store.gap_frequencies()} == {"c1", "c2"}
+    assert store.tags().num_rows == 2 * 6
+
+    # Aggregates and offset are reloaded together from the latest state
+    reopened = SwotAnalyticsStore(str(source), str(tmp_path / "store"))
+    assert reopened.refresh() == 0
+    assert reopened.top_tags("weaknesses", 1) == [{"tag": "financial planning", "count": 2}]
+
+
+def test_store_waits_for_complete_lines(tmp_path):
+    source = tmp_path / "reports.jsonl"
+    line = json.dumps({"report_id": "1", "report": REPORT})
+    source.write_text(line[:20])
+
+    store = SwotAnalyticsStore(str(source), str(tmp_path / "store"))
+    assert store.refresh() == 0
+    source.write_text(line + "\n")
+    assert store.refresh() == 1
+
+
+def test_interrupted_refresh_does_not_double_count(tmp_path, monkeypatch):
+    source = tmp_path / "reports.jsonl"
+    write_reports(source, [{"report_id": "1", "cohort": "c1", "report": REPORT}])
+    store = SwotAnalyticsStore(str(source), str(tmp_path / "store"))
+
+    def crash(*args):
+        raise OSError("disk full")
+
+    # Aggregates for the new version are written, then the state swap fails
+    monkeypatch.setattr("swot_analytics.os.replace", crash)
+    try:
+        store.refresh()
+    except OSError:
+        pass
+    monkeypatch.undo()
+
+    reopened = SwotAnalyticsStore(str(source), str(tmp_path / "store"))
+    assert reopened.refresh() == 1
+    assert reopened.top_tags("weaknesses", 1) == [{"tag": "financial planning", "count": 1}]
+
+
+def test_reports_to_table_dates_epoch_timestamps():
+    table = reports_to_table([
+        {"report_id": "1", "created_at": 1760000000.5, "report": REPORT},
+        {"report_id": "2", "created_at": "2026-10-01T10:00:00+00:00", "report": REPORT},
+    ])
+    assert set(table["date"].to_pylist()) == {"2025-10-09", "2026-10-01"}
+
+
+def test_generated_reports_reach_the_analytics(tmp_path, monkeypatch):
+    import gap_analysiss
+    source = tmp_path / "reports.jsonl"
+    monkeypatch.setattr(swot_analytics, "SWOT_REPORTS_PATH", str(source))
+    monkeypatch.setattr(gap_analysiss, "invoke_swot_analysis", lambda history, tenant: REPORT)
+
+    # Direct generation and a finished report job both export the report
+    assert gap_analysiss.generate_swot_analysis([], "c1") == REPORT
+    gap_analysiss.export_swot_job({"id": "job-1", "payload": {"tenant": "c2"}}, REPORT)
+    lines = source.read_text().splitlines(keepends=True)
+    assert len(lines) == 2 and all(line.endswith("\n") for line in lines)
+
+    store = SwotAnalyticsStore(str(source), str(tmp_path / "store"))
+    assert store.refresh() == 2
+    assert store.top_tags("weaknesses", 1) == [{"tag": "financial planning", "count": 2}]
+    today = datetime.now(timezone.utc).date().isoformat()
+    assert {(row["cohort"], row["date"]) for row in store.gap_frequencies()} == {
+        ("c1", today), ("c2", today)}
+
+
+def test_failed_generation_is_not_exported(tmp_path, monkeypatch):
+    import gap_analysiss
+    source = tmp_path / "reports.jsonl"
+    monkeypatch.setattr(swot_analytics, "SWOT_REPORTS_PATH", str(source))
+
+    def fail(history, tenant):
+        raise RuntimeError("upstream error")
+
+    monkeypatch.setattr(gap_analysiss, "invoke_swot_analysis", fail)
+    assert gap_analysiss.generate_swot_analysis([], "c1").startswith("I'm sorry")
+    assert not source.exists()
@@ -1,14 +1,128 @@
 import axios from "axios";
 
 const API_BASE_URL = "http://127.0.0.1:8000";  // FastAPI backend URL
+// Each EDP cohort or centre gets its own fair share of the LLM, e.g. ?cohort=centre-a
+const COHORT = new URLSearchParams(window.location.search).get("cohort") || "default";
+const WS_CHAT_URL = `${API_BASE_URL.replace(/^http/, "ws")}/ws/chat?cohort=${encodeURIComponent(COHORT)}`;
+
+const HEARTBEAT_INTERVAL = 15000;  // ms between client pings
+const RECONNECT_DELAY_MAX = 10000;  // ms cap for reconnect backoff
 
 // Function to Send Message to Backend
 export const chatWithAI = async (message) => {
   try {
-    const response = await axios.post(`${API_BASE_URL}/chat`, { message });
+    const response = await axios.post(`${API_BASE_URL}/chat`, { message, cohort: COHORT });
     return response.data.response;  // Extract AI response from JSON
   } catch (error) {
     console.error("Error connecting to backend:", error);
     return "Error processing your request.";
   }
-};
\ No newline at end of file
+};
+
+// One shared WebSocket per session, multiplexing advisor conversations by channel
+class ChatSocket {
+  constructor(url) {
+    this.url = url;
+    this.socket = null;
+    this.pending = {};  // channel -> { resolve, reject, onToken, text }
+    this.queue = [];  // frames (objects) sent while (re)connecting
+    this.reconnectDelay = 500;
+    this.heartbeat = null;
+  }
+
+  connect() {
+    if (this.socket && this.socket.readyState <= WebSocket.OPEN) return;
+
+    this.socket = new WebSocket(this.url);
+    this.socket.onopen = () => {
+      this.reconnectDelay = 500;
+      this.queue.splice(0).forEach((frame) => this.socket.send(JSON.stringify(frame)));
+      this.heartbeat = setInterval(() => this.sendFrame({ type: "ping" }), HEARTBEAT_INTERVAL);
+    };
+    this.socket.onmessage = (event) => this.handleFrame(JSON.parse(event.data));
+    this.socket.onclose = () => {
+      clearInterval(this.heartbeat);
+      // Replies in flight cannot be resumed on a new connection. Drop their
+      // queued messages too, or the server would stream replies nobody awaits
+      // into channels a retry is about to reuse
+      const lost = Object.keys(this.pending);
+      this.queue = this.queue.filter(
+        (frame) => frame.type !== "message" || !lost.includes(frame.channel));
+      lost.forEach((channel) => this.finish(channel, new Error("Connection to backend lost.")));
+      setTimeout(() => this.connect(), this.reconnectDelay);
+      this.reconnectDelay = Math.min(this.reconnectDelay * 2, RECONNECT_DELAY_MAX);
+    };
+  }
+
+  sendFrame(frame) {
+    if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+      this.socket.send(JSON.stringify(frame));
+    } else {
+      this.queue.push(frame);
+      this.connect();
+    }
+  }
+
+  handleFrame(frame) {
+    const request = this.pending[frame.channel];
+    switch (frame.type) {
+      case "ping":
+        this.sendFrame({ type: "pong" });
+        break;
+      case "token":
+        if (request) {
+          request.text += frame.content;
+          if (request.onToken) request.onToken(frame.content, request.text);
+        }
+        break;
+      case "done":
+        this.finish(frame.channel);
+        break;
+      case "error":
+        this.finish(frame.channel, new Error(frame.error));
+        break;
+      default:
+        break;
+    }
+  }
+
+  finish(channel, error) {
+    const request = this.pending[channel];
+    if (!request) return;
+    delete this.pending[channel];
+    if (error) request.reject(error);
+    else request.resolve(request.text);
+  }
+
+  send(channel, advisor, content, onToken) {
+    // One reply per channel at a time; the server would reject the overlap anyway
+    if (this.pending[channel]) {
+      return Promise.reject(new Error(`A reply is already streaming on channel "${channel}".`));
+    }
+    return new Promise((resolve, reject) => {
+      this.pending[channel] = { resolve, reject, onToken, text: "" };
+      this.sendFrame({ type: "message", channel, advisor, content });
+    });
+  }
+
+  cancel(channel) {
+    this.sendFrame({ type: "cancel", channel });
+    this.finish(channel, new Error("Cancelled."));
+  }
+
+  close(channel) {
+    this.sendFrame({ type: "close", channel });
+  }
+}
+
+export const chatSocket = new ChatSocket(WS_CHAT_URL);
+
+// Stream a reply over the shared socket; onToken(token, textSoFar) fires per token
+export const streamChatWithAI = async (message, { channel = "chat", advisor = "chat", onToken } = {}) => {
+  try {
+    return await chatSocket.send(channel, advisor, message, onToken);
+  } catch (error) {
+    console.error("Error streaming from backend:", error);
+    return "Error processing your request.";
+  }
+};